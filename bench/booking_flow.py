@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Load test for the gateway booking flow
+
+Starts the four services locally with uvicorn against throwaway SQLite files
+(or the databases given by --database-url), seeds cars, users and rentals,
+drives a mixed workload at a fixed concurrency and reports p50/p95/p99 and RPS
+per endpoint. Results are written as JSON so runs can be compared across commits:
+
+    python bench/booking_flow.py --cars 500 --rentals 200 --duration 30 --concurrency 32
+    python bench/booking_flow.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta, timezone, datetime
+
+import httpx
+from sqlalchemy import Boolean, Column, Integer, MetaData, String, Table, Uuid, create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES_DIR = os.path.join(ROOT, "services")
+
+# name, directory, port offset, database
+SERVICES = [
+    ("payment", "payment_service", 0, "payments"),
+    ("rental", "rental_service", 1, "rentals"),
+    ("cars", "cars_service", 2, "cars"),
+    ("gateway", "gateway_service", 3, None),
+]
+
+DEFAULT_MIX = "list_cars=40,user_rentals=25,get_rental=15,book_cancel=10,book_finish=10"
+
+cars_table = Table(
+    "cars", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("car_uid", Uuid(as_uuid=True)),
+    Column("brand", String(80)),
+    Column("model", String(80)),
+    Column("registration_number", String(20)),
+    Column("power", Integer),
+    Column("price", Integer),
+    Column("type", String(20)),
+    Column("availability", Boolean),
+)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.statuses: dict[str, dict[str, int]] = {}
+
+    def record(self, endpoint: str, seconds: float, status: int):
+        self.samples.setdefault(endpoint, []).append(seconds)
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def report(self, duration: float) -> dict:
+        report = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            report[endpoint] = {
+                "count": len(samples),
+                "rps": round(len(samples) / duration, 2),
+                "p50Ms": round(percentile(samples, 0.50) * 1000, 2),
+                "p95Ms": round(percentile(samples, 0.95) * 1000, 2),
+                "p99Ms": round(percentile(samples, 0.99) * 1000, 2),
+                "maxMs": round(max(samples) * 1000, 2),
+                "statuses": self.statuses[endpoint]
+            }
+        return report
+
+
+class Gateway:
+    def __init__(self, base_url: str, recorder: Recorder):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=30)
+        self.recorder = recorder
+
+    async def call(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class Workload:
+    def __init__(self, gateway: Gateway, car_uids: list[str], users: list[str], rentals: dict[str, list[str]]):
+        self.gateway = gateway
+        self.free_cars = list(car_uids)
+        self.users = users
+        self.rentals = rentals
+        self.total_cars = len(car_uids)
+
+    def headers(self, user: str) -> dict:
+        return {"X-User-Name": user}
+
+    async def list_cars(self):
+        page = random.randint(1, max(1, self.total_cars // 10))
+        await self.gateway.call("GET /api/v1/cars", "GET", "/api/v1/cars", params={"page": page, "size": 10, "showAll": True})
+
+    async def user_rentals(self):
+        user = random.choice(self.users)
+        await self.gateway.call("GET /api/v1/rental", "GET", "/api/v1/rental", headers=self.headers(user))
+
+    async def get_rental(self):
+        user = random.choice([user for user in self.users if self.rentals[user]] or self.users)
+        if not self.rentals[user]:
+            return
+        rental_uid = random.choice(self.rentals[user])
+        await self.gateway.call(
+            "GET /api/v1/rental/{rentalUid}", "GET", f"/api/v1/rental/{rental_uid}", headers=self.headers(user)
+        )
+
+    async def book(self, user: str):
+        if not self.free_cars:
+            return None, None
+        car_uid = self.free_cars.pop(random.randrange(len(self.free_cars)))
+        start = date(2021, 10, 1) + timedelta(days=random.randint(0, 365))
+        response = await self.gateway.call("POST /api/v1/rental", "POST", "/api/v1/rental", headers=self.headers(user), json={
+            "carUid": car_uid,
+            "dateFrom": start.isoformat(),
+            "dateTo": (start + timedelta(days=random.randint(1, 14))).isoformat()
+        })
+        if response.status_code != 200:
+            self.free_cars.append(car_uid)
+            return None, None
+        return car_uid, response.json()["rentalUid"]
+
+    async def book_cancel(self):
+        user = random.choice(self.users)
+        car_uid, rental_uid = await self.book(user)
+        if rental_uid:
+            await self.gateway.call(
+                "DELETE /api/v1/rental/{rentalUid}", "DELETE", f"/api/v1/rental/{rental_uid}", headers=self.headers(user)
+            )
+            self.free_cars.append(car_uid)
+
+    async def book_finish(self):
+        user = random.choice(self.users)
+        car_uid, rental_uid = await self.book(user)
+        if rental_uid:
+            await self.gateway.call(
+                "POST /api/v1/rental/{rentalUid}/finish", "POST", f"/api/v1/rental/{rental_uid}/finish",
+                headers=self.headers(user)
+            )
+            self.free_cars.append(car_uid)
+
+
+def parse_mix(mix: str) -> tuple[list[str], list[int]]:
+    operations, weights = [], []
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        operations.append(name.strip())
+        weights.append(int(weight))
+    return operations, weights
+
+
+def sync_url(url: str) -> str:
+    return url.replace("+asyncpg", "").replace("+aiosqlite", "")
+
+
+def start_services(args, workdir: str) -> list[subprocess.Popen]:
+    processes = []
+    for name, directory, offset, database in SERVICES:
+        env = dict(os.environ)
+        env.update({
+            "CARS_SERVICE_URL": f"http://127.0.0.1:{args.base_port + 2}",
+            "RENTAL_SERVICE_URL": f"http://127.0.0.1:{args.base_port + 1}",
+            "PAYMENT_SERVICE_URL": f"http://127.0.0.1:{args.base_port}",
+            "SAGA_DB_PATH": os.path.join(workdir, "saga.db"),
+        })
+        if database:
+            env["DATABASE_URL"] = args.database_url.format(database=database, workdir=workdir)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(args.base_port + offset), "--log-level", "warning"],
+            cwd=os.path.join(SERVICES_DIR, directory),
+            env=env
+        ))
+    return processes
+
+
+async def wait_ready(args):
+    async with httpx.AsyncClient(timeout=1) as client:
+        for _, _, offset, _ in SERVICES:
+            url = f"http://127.0.0.1:{args.base_port + offset}/manage/health"
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if (await client.get(url)).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up")
+                await asyncio.sleep(0.2)
+
+
+def seed_cars(args, workdir: str) -> list[str]:
+    engine = create_engine(sync_url(args.database_url.format(database="cars", workdir=workdir)))
+    car_uids = [uuid.uuid4() for _ in range(args.cars)]
+    with engine.begin() as conn:
+        conn.execute(cars_table.insert(), [
+            {
+                "car_uid": car_uid,
+                "brand": random.choice(["Mercedes Benz", "BMW", "Audi", "Toyota"]),
+                "model": f"Model {index}",
+                "registration_number": f"BN{index:07d}",
+                "power": random.randint(90, 400),
+                "price": random.randint(1000, 9000),
+                "type": random.choice(["SEDAN", "SUV", "MINIVAN", "ROADSTER"]),
+                "availability": True
+            }
+            for index, car_uid in enumerate(car_uids)
+        ])
+    engine.dispose()
+    return [str(car_uid) for car_uid in car_uids]
+
+
+async def seed_rentals(workload: Workload, count: int):
+    for index in range(count):
+        user = workload.users[index % len(workload.users)]
+        _, rental_uid = await workload.book(user)
+        if rental_uid:
+            workload.rentals[user].append(rental_uid)
+
+
+async def run_workload(workload: Workload, args) -> float:
+    operations, weights = parse_mix(args.mix)
+    deadline = time.monotonic() + args.duration
+
+    async def worker():
+        while time.monotonic() < deadline:
+            operation = random.choices(operations, weights)[0]
+            await getattr(workload, operation)()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return time.perf_counter() - started
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"{'endpoint':40} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for endpoint, stats in report.items():
+        line = (f"{endpoint:40} {stats['count']:>7} {stats['rps']:>8} "
+                f"{stats['p50Ms']:>8} {stats['p95Ms']:>8} {stats['p99Ms']:>8}")
+        if baseline and endpoint in baseline:
+            line += f"   p95 {stats['p95Ms'] - baseline[endpoint]['p95Ms']:+.2f}ms"
+        print(line)
+
+
+async def main(args):
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="rental-bench-")
+    processes = start_services(args, workdir)
+    try:
+        await wait_ready(args)
+        car_uids = seed_cars(args, workdir)
+        users = [f"bench-user-{index}" for index in range(args.users)]
+
+        recorder = Recorder()
+        gateway = Gateway(f"http://127.0.0.1:{args.base_port + 3}", recorder)
+        workload = Workload(gateway, car_uids, users, {user: [] for user in users})
+        await seed_rentals(workload, args.rentals)
+
+        # Seeding traffic is not part of the measurement
+        recorder.__init__()
+        duration = await run_workload(workload, args)
+        await gateway.aclose()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    report = recorder.report(duration)
+    result = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "durationSeconds": round(duration, 3),
+        "endpoints": report
+    }
+    with open(args.output, "w") as output:
+        json.dump(result, output, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as previous:
+            baseline = json.load(previous)["endpoints"]
+    print_report(report, baseline)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///{workdir}/{database}.db",
+                        help="URL template with {database} (and optionally {workdir}) placeholders")
+    parser.add_argument("--base-port", type=int, default=18050)
+    parser.add_argument("--cars", type=int, default=500)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rentals", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight pairs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results JSON to diff p95 against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Memory and latency profile for one page of the cars catalog
+
+Loads a get_cars page from a throwaway SQLite catalog and turns it into the
+response body, the two ways the read handlers have done it:
+
+    entities  select(Car): full ORM entities, each registered in the identity map
+              with its loaded state kept for change tracking
+    rows      select(*CAR_COLUMNS): plain Row tuples straight from the cursor
+
+Both bodies are built with the service's own car_to_dict, which unpacks rows by
+position, and encoded with orjson; entities are read attribute by attribute.
+Latency is measured without tracing; peak memory per page comes from a separate
+tracemalloc pass and GC pressure from the collector's own counters:
+
+    python bench/cars_page_profile.py --items 100 --repeat 2000
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="cars-profile-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'cars.db')}"
+sys.path.insert(0, os.path.join(ROOT, "services", "cars_service"))
+
+import orjson  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+from database import Base, SessionLocal, get_engine  # noqa: E402
+from main import CAR_COLUMNS, car_to_dict  # noqa: E402
+from models import Car  # noqa: E402
+
+
+def seed(count: int):
+    engine = get_engine()
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Car), [
+            {
+                "car_uid": uuid.uuid4(),
+                "brand": "Mercedes Benz",
+                "model": f"GLA {index}",
+                "registration_number": f"ЛО{index:03d}Х799",
+                "power": 249,
+                "price": 3500,
+                "type": "SEDAN",
+                "availability": True
+            }
+            for index in range(count)
+        ])
+
+
+def entities(size: int) -> bytes:
+    with SessionLocal() as session:
+        cars = session.execute(select(Car).order_by(Car.id).limit(size)).scalars().all()
+        return orjson.dumps([car_to_dict([getattr(car, column.key) for column in CAR_COLUMNS]) for car in cars])
+
+
+def rows(size: int) -> bytes:
+    with SessionLocal() as session:
+        result = session.execute(select(*CAR_COLUMNS, Car.id).order_by(Car.id).limit(size))
+        return orjson.dumps([car_to_dict(row) for row in result])
+
+
+STRATEGIES = {"entities": entities, "rows": rows}
+
+
+def latency(load, size: int, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        load(size)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def peak_memory(load, size: int, repeat: int) -> float:
+    # Highest traced memory while one page is loaded and encoded, over what was live before it
+    tracemalloc.start()
+    peaks = []
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        load(size)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+    return statistics.mean(peaks)
+
+
+def collections(load, size: int, repeat: int) -> float:
+    gc.collect()
+    before = sum(generation["collections"] for generation in gc.get_stats())
+    for _ in range(repeat):
+        load(size)
+    after = sum(generation["collections"] for generation in gc.get_stats())
+    return (after - before) * 1000 / repeat
+
+
+def main(args):
+    seed(args.items)
+    bodies = {name: load(args.items) for name, load in STRATEGIES.items()}
+    assert bodies["entities"] == bodies["rows"], "strategies disagree on the payload"
+    for load in STRATEGIES.values():
+        latency(load, args.items, args.repeat // 10 or 1)
+
+    print(f"{args.items}-item page, {args.repeat} runs, database in {WORKDIR}")
+    print(f"{'strategy':10} {'p50 ms':>8} {'p99 ms':>8} {'peak KiB':>9} {'gc/1k pages':>12}")
+    for name, load in STRATEGIES.items():
+        samples = sorted(latency(load, args.items, args.repeat))
+        p50 = samples[len(samples) // 2] * 1e3
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e3
+        peak = peak_memory(load, args.items, max(args.repeat // 10, 1))
+        gcs = collections(load, args.items, args.repeat)
+        print(f"{name:10} {p50:>8.3f} {p99:>8.3f} {peak / 1024:>9.1f} {gcs:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+    main(parser.parse_args())
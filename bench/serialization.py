@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the cars page serialization path
+
+Compares the per-item cost of turning database rows into a JSON body:
+
+    models   CarResponse per row, the page re-validated against response_model,
+             dumped by alias and encoded with stdlib json (the old handler path)
+    dump     CarResponse per row, encoded once with model_dump_json
+    orjson   plain dicts built from the column rows, encoded with orjson (the current path)
+
+    python bench/serialization.py --items 100 --repeat 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from collections import namedtuple
+
+import orjson
+from pydantic import TypeAdapter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "services", "cars_service"))
+
+from schemas import CarResponse, PaginationResponse  # noqa: E402
+
+CarRow = namedtuple(
+    "CarRow", "id car_uid brand model registration_number power price type availability"
+)
+
+page_adapter = TypeAdapter(PaginationResponse)
+
+
+def make_rows(count: int) -> list[CarRow]:
+    return [
+        CarRow(index, uuid.uuid4(), "Mercedes Benz", f"GLA {index}", f"ЛО{index:03d}Х799", 249, 3500, "SEDAN", True)
+        for index in range(count)
+    ]
+
+
+def to_model(row: CarRow) -> CarResponse:
+    return CarResponse(
+        car_uid=row.car_uid,
+        brand=row.brand,
+        model=row.model,
+        registration_number=row.registration_number,
+        power=row.power,
+        price=row.price,
+        type=row.type,
+        available=row.availability
+    )
+
+
+def to_dict(row: CarRow) -> dict:
+    return {
+        "carUid": str(row.car_uid),
+        "brand": row.brand,
+        "model": row.model,
+        "registrationNumber": row.registration_number,
+        "power": row.power,
+        "price": row.price,
+        "type": row.type,
+        "available": row.availability
+    }
+
+
+def to_page(rows: list[CarRow]) -> PaginationResponse:
+    items = [to_model(row) for row in rows]
+    return PaginationResponse(page=1, page_size=len(items), total_elements=len(items), items=items)
+
+
+def models(rows: list[CarRow]) -> bytes:
+    # response_model handling: the returned model is dumped, validated again, then dumped by alias
+    validated = page_adapter.validate_python(to_page(rows).model_dump())
+    content = page_adapter.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dump(rows: list[CarRow]) -> bytes:
+    return to_page(rows).model_dump_json(by_alias=True).encode()
+
+
+def fast(rows: list[CarRow]) -> bytes:
+    return orjson.dumps({
+        "page": 1,
+        "pageSize": len(rows),
+        "totalElements": len(rows),
+        "nextCursor": None,
+        "items": [to_dict(row) for row in rows]
+    })
+
+
+STRATEGIES = {"models": models, "dump": dump, "orjson": fast}
+
+
+def measure(serialize, rows: list[CarRow], repeat: int) -> float:
+    serialize(rows)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        serialize(rows)
+    return (time.perf_counter() - started) / (repeat * len(rows))
+
+
+def main(args):
+    rows = make_rows(args.items)
+    # Same payload from every strategy, so only the cost differs
+    bodies = {name: json.loads(serialize(rows)) for name, serialize in STRATEGIES.items()}
+    assert bodies["models"] == bodies["orjson"] == bodies["dump"], "strategies disagree on the payload"
+
+    baseline = None
+    print(f"{'strategy':10} {'us/item':>10} {'speedup':>8}")
+    for name, serialize in STRATEGIES.items():
+        per_item = measure(serialize, rows, args.repeat) * 1e6
+        baseline = baseline or per_item
+        print(f"{name:10} {per_item:>10.3f} {baseline / per_item:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+    main(parser.parse_args())
@@ -10,6 +10,9 @@ GRANT ALL PRIVILEGES ON DATABASE payments TO program;
 -- Connect to cars database
 \c cars;
 
+-- The booking calendar's exclusion constraint needs it; created here in case program may not
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 -- Create cars table
 CREATE TABLE IF NOT EXISTS cars
 (
@@ -28,6 +31,8 @@ CREATE TABLE IF NOT EXISTS cars
 -- Grant permissions to program user
 GRANT ALL PRIVILEGES ON TABLE cars TO program;
 GRANT USAGE, SELECT ON SEQUENCE cars_id_seq TO program;
+-- Services run their own migrations (indexes, new columns), which requires ownership
+ALTER TABLE cars OWNER TO program;
 
 -- Insert test data
 INSERT INTO cars (car_uid, brand, model, registration_number, power, type, price, availability)
@@ -54,6 +59,8 @@ CREATE TABLE IF NOT EXISTS rental
 -- Grant permissions to program user
 GRANT ALL PRIVILEGES ON TABLE rental TO program;
 GRANT USAGE, SELECT ON SEQUENCE rental_id_seq TO program;
+-- Services run their own migrations (indexes, new columns), which requires ownership
+ALTER TABLE rental OWNER TO program;
 
 -- Connect to payments database
 \c payments;
@@ -70,4 +77,6 @@ CREATE TABLE IF NOT EXISTS payment
 
 -- Grant permissions to program user
 GRANT ALL PRIVILEGES ON TABLE payment TO program;
-GRANT USAGE, SELECT ON SEQUENCE payment_id_seq TO program;
\ No newline at end of file
+GRANT USAGE, SELECT ON SEQUENCE payment_id_seq TO program;
+-- Services run their own migrations (indexes, new columns), which requires ownership
+ALTER TABLE payment OWNER TO program;
\ No newline at end of file
@@ -0,0 +1,86 @@
+import uuid
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import Boolean, Uuid, and_, delete, exists, func, insert, literal, select, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import IS_POSTGRES
+from models import Car, CarBooking
+
+
+def booking_period(date_from: date, date_to: date) -> tuple[date, date]:
+    # Reversed dates are accepted like the gateway's price calculation does; a same-day rental holds one day
+    start, end = sorted((date_from, date_to))
+    return start, max(end, start + timedelta(days=1))
+
+
+def overlaps(date_from: date, date_to: date):
+    if IS_POSTGRES:
+        # The exclusion constraint's own expression, so its GiST index serves the lookup
+        booked = func.daterange(CarBooking.date_from, CarBooking.date_to, "[)")
+        return booked.op("&&")(func.daterange(date_from, date_to, "[)"))
+    return and_(CarBooking.date_from < date_to, CarBooking.date_to > date_from)
+
+
+def free_between(date_from: date, date_to: date):
+    # Correlated with the outer cars query: one anti-join, not a lookup per car
+    return ~exists().where(CarBooking.car_id == Car.id, overlaps(date_from, date_to))
+
+
+def available_on(day: date):
+    # Car.availability is only the undated reserve; dated bookings live in the calendar alone, so what a car
+    # is doing on a given day is read from there rather than from a flag nothing updates as days pass
+    booked = exists().where(CarBooking.car_id == Car.id, overlaps(day, day + timedelta(days=1)))
+    return type_coerce(and_(Car.availability == True, ~booked), Boolean)
+
+
+def bookable_between(date_from: date, date_to: date):
+    # The undated reserve has no end date, so it blocks every range
+    return and_(free_between(date_from, date_to), Car.availability == True)
+
+
+async def has_outstanding(db: AsyncSession, car_id: int, today: date) -> bool:
+    # Any booking not over yet; an undated hold taken now would run into it
+    return await db.scalar(select(exists().where(CarBooking.car_id == car_id, CarBooking.date_to > today)))
+
+
+async def book(
+    db: AsyncSession,
+    car_id: int,
+    date_from: date,
+    date_to: date,
+    booking_uid: Optional[uuid.UUID] = None
+) -> bool:
+    # One statement, so on SQLite the check and the insert cannot interleave with another booking;
+    # on Postgres concurrent inserts can both pass the check and the exclusion constraint decides
+    clash = exists().where(CarBooking.car_id == car_id, overlaps(date_from, date_to))
+    try:
+        result = await db.execute(
+            insert(CarBooking).from_select(
+                ["car_id", "date_from", "date_to", "booking_uid"],
+                select(literal(car_id), literal(date_from), literal(date_to), literal(booking_uid, Uuid)).where(~clash)
+            )
+        )
+    except IntegrityError:
+        return False
+    return result.rowcount == 1
+
+
+async def release(
+    db: AsyncSession,
+    car_id: int,
+    date_from: date,
+    date_to: date,
+    booking_uid: Optional[uuid.UUID] = None
+):
+    query = delete(CarBooking).where(
+        CarBooking.car_id == car_id, CarBooking.date_from == date_from, CarBooking.date_to == date_to
+    )
+    # A booking is only ever released by its own uid, so a repeated or late release cannot take the dates
+    # from whoever booked them next. Without a uid only bookings made before they were tagged match
+    query = query.where(
+        CarBooking.booking_uid.is_(None) if booking_uid is None else CarBooking.booking_uid == booking_uid
+    )
+    await db.execute(query.execution_options(synchronize_session=False))
@@ -0,0 +1,51 @@
+import os
+from datetime import date
+from typing import Optional
+
+from fastapi import Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import CatalogVersion
+
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "0"))
+
+
+async def current_version(db: AsyncSession) -> int:
+    return await db.scalar(select(CatalogVersion.version).where(CatalogVersion.id == 1))
+
+
+async def bump_version(db: AsyncSession):
+    # Called after the change commits, as a transaction of its own: writers then share the row lock
+    # for one UPDATE instead of their whole transaction. Until it lands the ETag still names the old
+    # version, so a revalidation in that window can get a 304 for the previous body
+    await db.execute(
+        update(CatalogVersion)
+        .where(CatalogVersion.id == 1)
+        .values(version=CatalogVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+def make_etag(version: int, day: date, weak: bool = False) -> str:
+    return f'{"W/" if weak else ""}"catalog-{version}-{day.isoformat()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def cache_headers(etag: str) -> dict:
+    # Availability is live data: caches may keep the body but must check the ETag before reuse
+    return {"ETag": etag, "Cache-Control": f"max-age={CATALOG_MAX_AGE}, must-revalidate"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
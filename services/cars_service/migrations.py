@@ -0,0 +1,155 @@
+import asyncio
+from datetime import date
+
+from sqlalchemy import (
+    BigInteger, Boolean, CheckConstraint, Column, Date, DateTime, ForeignKey, Integer, MetaData, String, Table, Uuid,
+    func, inspect, text
+)
+from starlette.concurrency import run_in_threadpool
+
+from database import ASYNC_MODE, IS_POSTGRES, get_engine
+
+MIGRATIONS_TABLE = "schema_migrations"
+ADVISORY_LOCK_ID = 70701
+
+# Table definitions are frozen copies: models.py may move on, applied migrations must not
+
+
+def create_cars_table(conn):
+    Table(
+        "cars", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("car_uid", Uuid(as_uuid=True), unique=True, nullable=False),
+        Column("brand", String(80), nullable=False),
+        Column("model", String(80), nullable=False),
+        Column("registration_number", String(20), nullable=False),
+        Column("power", Integer),
+        Column("price", Integer, nullable=False),
+        Column("type", String(20)),
+        Column("availability", Boolean, nullable=False),
+        CheckConstraint("type IN ('SEDAN', 'SUV', 'MINIVAN', 'ROADSTER')", name="car_type_check")
+    ).create(conn, checkfirst=True)
+
+
+def create_available_cars_index(conn):
+    # Serves the default "available only" listing ordered by id, in both offset and keyset mode
+    create_index(
+        conn, "cars", "ix_cars_available_id",
+        "CREATE INDEX ix_cars_available_id ON cars (id) WHERE availability"
+    )
+
+
+def create_catalog_version_table(conn):
+    # A single row, bumped after every availability change; the ETags derive from it
+    catalog_version = Table(
+        "catalog_version", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("version", BigInteger, nullable=False)
+    )
+    catalog_version.create(conn, checkfirst=True)
+    if conn.execute(catalog_version.select()).first() is None:
+        conn.execute(catalog_version.insert().values(id=1, version=1))
+
+
+def create_car_booking_table(conn):
+    if IS_POSTGRES:
+        # btree_gist lets the exclusion constraint compare car_id with = next to the range operator.
+        # It is a trusted extension, and db-v3.sql creates it up front for installs where it is not
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        conn.exec_driver_sql("""
+            CREATE TABLE IF NOT EXISTS car_booking (
+                id        SERIAL PRIMARY KEY,
+                car_id    INT  NOT NULL REFERENCES cars (id) ON DELETE CASCADE,
+                date_from DATE NOT NULL,
+                date_to   DATE NOT NULL,
+                CONSTRAINT car_booking_dates_check CHECK (date_from < date_to),
+                CONSTRAINT car_booking_no_overlap
+                    EXCLUDE USING gist (car_id WITH =, daterange(date_from, date_to, '[)') WITH &&)
+            )
+        """)
+        return
+    metadata = MetaData()
+    # Only the referenced key, so the foreign key resolves without redefining the cars table
+    Table("cars", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "car_booking", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("car_id", Integer, ForeignKey("cars.id", ondelete="CASCADE"), nullable=False),
+        Column("date_from", Date, nullable=False),
+        Column("date_to", Date, nullable=False),
+        CheckConstraint("date_from < date_to", name="car_booking_dates_check")
+    ).create(conn, checkfirst=True)
+    create_index(
+        conn, "car_booking", "ix_car_booking_car_id_date_from",
+        "CREATE INDEX ix_car_booking_car_id_date_from ON car_booking (car_id, date_from)"
+    )
+
+
+def add_car_booking_uid(conn):
+    if "booking_uid" not in {column["name"] for column in inspect(conn).get_columns("car_booking")}:
+        # Rendered per dialect: uuid on Postgres, CHAR(32) on SQLite
+        column_type = Uuid().compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE car_booking ADD COLUMN booking_uid {column_type}")
+
+
+def restore_flags_cleared_by_bookings(conn):
+    # Dated bookings used to clear the availability flag when they covered the day they were made;
+    # the flag now means an undated reserve only. A car with a booking not over yet cannot also be
+    # under an undated reserve, so its cleared flag came from a booking
+    conn.execute(
+        text(
+            "UPDATE cars SET availability = :available WHERE availability = :held AND EXISTS "
+            "(SELECT 1 FROM car_booking WHERE car_booking.car_id = cars.id AND car_booking.date_to > :today)"
+        ),
+        {"available": True, "held": False, "today": date.today()}
+    )
+
+
+MIGRATIONS = [
+    ("0001_create_cars", create_cars_table),
+    ("0002_cars_available_id_index", create_available_cars_index),
+    ("0003_catalog_version", create_catalog_version_table),
+    ("0004_car_booking", create_car_booking_table),
+    ("0005_car_booking_uid", add_car_booking_uid),
+    ("0006_availability_flag_undated_only", restore_flags_cleared_by_bookings),
+]
+
+
+def create_index(conn, table: str, name: str, ddl: str):
+    if name not in {index["name"] for index in inspect(conn).get_indexes(table)}:
+        conn.exec_driver_sql(ddl)
+
+
+def upgrade(conn) -> list[str]:
+    if IS_POSTGRES:
+        # Workers starting together queue here; the lock is released on commit
+        conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({ADVISORY_LOCK_ID})")
+
+    Table(
+        MIGRATIONS_TABLE, MetaData(),
+        Column("version", String(64), primary_key=True),
+        Column("applied_at", DateTime(timezone=True), nullable=False, server_default=func.now())
+    ).create(conn, checkfirst=True)
+
+    applied = set(conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}")).scalars())
+    pending = [(version, migration) for version, migration in MIGRATIONS if version not in applied]
+    for version, migration in pending:
+        migration(conn)
+        conn.execute(text(f"INSERT INTO {MIGRATIONS_TABLE} (version) VALUES (:version)"), {"version": version})
+    return [version for version, _ in pending]
+
+
+async def migrate() -> list[str]:
+    if ASYNC_MODE:
+        async with get_engine().begin() as conn:
+            return await conn.run_sync(upgrade)
+
+    def run():
+        with get_engine().begin() as conn:
+            return upgrade(conn)
+
+    return await run_in_threadpool(run)
+
+
+if __name__ == "__main__":
+    print("Applied:", asyncio.run(migrate()) or "nothing")
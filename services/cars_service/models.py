@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    BigInteger, Column, Date, ForeignKey, Integer, String, Boolean, CheckConstraint, Index, Uuid, text
+)
 import uuid
 from database import Base
 
@@ -8,13 +9,14 @@ class Car(Base):
     __tablename__ = "cars"
 
     id = Column(Integer, primary_key=True, index=True)
-    car_uid = Column(UUID(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False)
+    car_uid = Column(Uuid(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False)
     brand = Column(String(80), nullable=False)
     model = Column(String(80), nullable=False)
     registration_number = Column(String(20), nullable=False)
     power = Column(Integer)
     price = Column(Integer, nullable=False)
     type = Column(String(20))
+    # Cleared by an undated reserve only; dated bookings are in car_booking and never touch it
     availability = Column(Boolean, nullable=False, default=True)
 
     __table_args__ = (
@@ -22,4 +24,34 @@ class Car(Base):
             "type IN ('SEDAN', 'SUV', 'MINIVAN', 'ROADSTER')",
             name="car_type_check"
         ),
+        Index(
+            "ix_cars_available_id", "id",
+            postgresql_where=text("availability"),
+            sqlite_where=text("availability")
+        ),
+    )
+
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+
+
+class CarBooking(Base):
+    __tablename__ = "car_booking"
+
+    id = Column(Integer, primary_key=True)
+    car_id = Column(Integer, ForeignKey("cars.id", ondelete="CASCADE"), nullable=False)
+    # Half-open [date_from, date_to): the return day is free for the next renter
+    date_from = Column(Date, nullable=False)
+    date_to = Column(Date, nullable=False)
+    # The gateway booking attempt that made the row; NULL for bookings made before it was recorded
+    booking_uid = Column(Uuid(as_uuid=True))
+
+    __table_args__ = (
+        CheckConstraint("date_from < date_to", name="car_booking_dates_check"),
+        # SQLite overlap lookups; on Postgres the migration adds a GiST exclusion constraint instead
+        Index("ix_car_booking_car_id_date_from", "car_id", "date_from"),
     )
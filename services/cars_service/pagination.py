@@ -0,0 +1,91 @@
+import base64
+import binascii
+import json
+import os
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import IS_POSTGRES, get_engine
+
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+
+
+def encode_cursor(last_id: int) -> str:
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[int]:
+    # An empty cursor opts into keyset mode from the first row
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class CountCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[str, tuple[float, int]] = {}
+
+    def get(self, key: str) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: int):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        self._entries.clear()
+
+
+count_cache = CountCache(COUNT_CACHE_TTL)
+
+
+async def exact_count(db: AsyncSession, query) -> int:
+    return await db.scalar(select(func.count()).select_from(query.subquery()))
+
+
+async def estimated_count(db: AsyncSession, query, table_name: str, filtered: bool) -> Optional[int]:
+    if not IS_POSTGRES:
+        return None
+    if not filtered:
+        estimate = await db.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+            {"table": table_name}
+        )
+    else:
+        # The planner's row estimate for the filtered scan, no rows are read
+        compiled = query.with_only_columns(literal_column("1")).compile(
+            dialect=get_engine().dialect, compile_kwargs={"literal_binds": True}
+        )
+        plan = await db.scalar(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]["Plan"]["Plan Rows"]
+    # reltuples stays 0/-1 until the first ANALYZE
+    return int(estimate) if estimate and estimate > 0 else None
+
+
+async def total_count(db: AsyncSession, query, mode: str, cache_key: str, table_name: str, filtered: bool) -> int:
+    if mode == "estimate":
+        estimate = await estimated_count(db, query, table_name, filtered)
+        if estimate is not None:
+            return estimate
+    elif mode == "cached":
+        cached = count_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        total = await exact_count(db, query)
+        count_cache.set(cache_key, total)
+        return total
+    return await exact_count(db, query)
@@ -1,7 +1,11 @@
+from datetime import date
+
 from pydantic import BaseModel, Field
 from uuid import UUID
 from typing import Literal, Optional
 
+MAX_BATCH_SIZE = 100
+
 
 class CarBase(BaseModel):
     brand: str
@@ -36,7 +40,30 @@ class PaginationResponse(BaseModel):
     page: int
     page_size: int = Field(serialization_alias="pageSize")
     total_elements: int = Field(serialization_alias="totalElements")
+    next_cursor: Optional[str] = Field(None, serialization_alias="nextCursor")
     items: list[CarResponse]
 
     class Config:
         populate_by_name = True
+
+
+class CarBatchRequest(BaseModel):
+    car_uids: list[UUID] = Field(validation_alias="carUids", min_length=1, max_length=MAX_BATCH_SIZE)
+
+    class Config:
+        populate_by_name = True
+
+
+class CarBatchResponse(BaseModel):
+    items: dict[UUID, CarResponse]
+    missing: list[UUID]
+
+
+class CarReservation(BaseModel):
+    date_from: date = Field(validation_alias="dateFrom")
+    date_to: date = Field(validation_alias="dateTo")
+    # Set by the gateway to its booking attempt, so the attempt can be undone by that name alone
+    booking_uid: Optional[UUID] = Field(None, validation_alias="bookingUid")
+
+    class Config:
+        populate_by_name = True
@@ -0,0 +1,66 @@
+import os
+
+from starlette.responses import JSONResponse
+
+from metrics import HTTP_REQUESTS_SHED
+
+# Per worker; 0 disables shedding
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "100"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+# Probes and metrics must keep answering while the worker sheds traffic
+EXEMPT_PREFIX = "/manage/"
+
+
+class Admission:
+    """Counts requests in flight; past the limit new ones are turned away instead of queueing."""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+
+    @property
+    def saturated(self) -> bool:
+        return 0 < self.max_in_flight <= self.in_flight
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": self.in_flight,
+            "maxInFlight": self.max_in_flight,
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
+
+
+admission = Admission(ADMISSION_MAX_IN_FLIGHT)
+
+
+class AdmissionMiddleware:
+    """Outermost middleware, so a shed request costs one counter check and a canned 503."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        if admission.saturated:
+            admission.shed += 1
+            HTTP_REQUESTS_SHED.inc()
+            response = JSONResponse(
+                {"detail": "Service overloaded"},
+                status_code=503,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)}
+            )
+            await response(scope, receive, send)
+            return
+
+        admission.in_flight += 1
+        admission.admitted += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.in_flight -= 1
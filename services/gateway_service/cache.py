@@ -0,0 +1,100 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+
+class CacheBackend:
+    """Async key/value interface, so a shared cache can replace the in-process one without touching handlers."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        result = {}
+        for key in keys:
+            value = await self.get(key)
+            if value is not None:
+                result[key] = value
+        return result
+
+    async def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class LRUTTLCache(CacheBackend):
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def build_cache(prefix: str, default_size: int, default_ttl: float) -> CacheBackend:
+    backend = os.getenv(f"{prefix}_BACKEND", "memory")
+    if backend != "memory":
+        raise ValueError(f"Unsupported {prefix}_BACKEND: {backend}")
+    return LRUTTLCache(
+        max_size=int(os.getenv(f"{prefix}_SIZE", str(default_size))),
+        ttl=float(os.getenv(f"{prefix}_TTL", str(default_ttl)))
+    )
+
+
+car_cache = build_cache("CAR_CACHE", default_size=10000, default_ttl=3600)
+# Catalog responses with their ETags; always revalidated, the TTL only bounds how long unused pages stay
+catalog_cache = build_cache("CATALOG_CACHE", default_size=1000, default_ttl=300)
@@ -0,0 +1,307 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from resilience import (
+    IDEMPOTENT_METHODS, CircuitBreaker, CircuitOpenError, ResiliencePolicy, RetryBudget,
+    backoff, build_retry_budget, is_failure, is_transient, policy_for
+)
+from metrics import DOWNSTREAM_IN_FLIGHT, DOWNSTREAM_SECONDS, outcome_of
+from singleflight import SINGLEFLIGHT_MAX_WAITERS, SingleFlight
+from tracing import ENABLED as TRACING_ENABLED, Span, client_span, inject, new_span
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# name: (env prefix, default url, coalesce identical GETs by default)
+SERVICES = {
+    "cars": ("CARS_SERVICE", "http://cars:8070", True),
+    "rental": ("RENTAL_SERVICE", "http://rental:8060", False),
+    "payment": ("PAYMENT_SERVICE", "http://payment:8050", True),
+}
+
+MAX_CONNECTIONS = int(os.getenv("DOWNSTREAM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("DOWNSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("DOWNSTREAM_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("DOWNSTREAM_HTTP2", "true").lower() == "true" and HTTP2_AVAILABLE
+
+
+class ServiceClient:
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        timeout: httpx.Timeout,
+        limits: httpx.Limits,
+        policy: ResiliencePolicy,
+        retry_budget: RetryBudget,
+        singleflight: Optional[SingleFlight] = None
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.max_connections = limits.max_connections
+        self.policy = policy
+        self.retry_budget = retry_budget
+        self.singleflight = singleflight
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.reset_timeout, policy.half_open_max_calls)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=limits,
+            http2=HTTP2_ENABLED
+        )
+
+    async def request(self, method: str, url: str, retryable: Optional[bool] = None, **kwargs) -> httpx.Response:
+        # Identical plain GETs in flight at the same time share one downstream call, retries included
+        if self.singleflight is not None and method == "GET" and kwargs.keys() <= {"params", "headers"}:
+            headers = sorted((kwargs.get("headers") or {}).items())
+            key = f"{url}?{httpx.QueryParams(kwargs.get('params'))}|{headers}"
+            return await self.singleflight.do(key, lambda: self._request(method, url, retryable, **kwargs))
+        return await self._request(method, url, retryable, **kwargs)
+
+    async def _request(self, method: str, url: str, retryable: Optional[bool], **kwargs) -> httpx.Response:
+        # Only reads are retried or hedged unless the caller vouches for the request
+        if retryable is None:
+            retryable = method in IDEMPOTENT_METHODS
+        self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            try:
+                if retryable and self.policy.hedge_after > 0:
+                    response = await self._hedged(method, url, **kwargs)
+                else:
+                    response = await self._attempt(method, url, **kwargs)
+            except CircuitOpenError:
+                raise
+            except httpx.TransportError:
+                if not self._may_retry(retryable, attempt):
+                    raise
+            else:
+                if not (is_transient(response) and self._may_retry(retryable, attempt)):
+                    return response
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(backoff(attempt))
+
+    def _may_retry(self, retryable: bool, attempt: int) -> bool:
+        return retryable and attempt < self.policy.retries and self.retry_budget.withdraw()
+
+    async def _attempt(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker for {self.name} is open")
+        self._enter()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with client_span(f"{method} {self.name}") as span:
+                response = await self._client.request(method, url, **self._traced(span, url, kwargs))
+                outcome = outcome_of(response.status_code)
+                if span is not None:
+                    span.attributes["http.status_code"] = response.status_code
+        except httpx.RequestError:
+            self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            # A losing hedge or a caller that went away
+            outcome = "cancelled"
+            self.breaker.release()
+            raise
+        finally:
+            self._leave(method, outcome, started)
+        if is_failure(response):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _hedged(self, method: str, url: str, **kwargs) -> httpx.Response:
+        pending = {asyncio.create_task(self._attempt(method, url, **kwargs))}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.policy.hedge_after)
+            # A hedge is an extra request, so it is paid for from the same budget as retries
+            if not done and self.retry_budget.withdraw():
+                self.hedges += 1
+                pending.add(asyncio.create_task(self._attempt(method, url, **kwargs)))
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and not is_transient(task.result()):
+                        return task.result()
+                if not pending:
+                    # Every attempt failed; surface the last one to the retry loop
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        # Streamed bodies can't be replayed, so no retries or hedging; the breaker still applies
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker for {self.name} is open")
+        self._enter()
+        started = time.perf_counter()
+        outcome = "error"
+        # Not made the current span: the body is read and the stream closed from the response task
+        span = new_span(f"{method} {self.name}", "client") if TRACING_ENABLED else None
+        try:
+            async with self._client.stream(method, url, **self._traced(span, url, kwargs)) as response:
+                outcome = outcome_of(response.status_code)
+                DOWNSTREAM_SECONDS.labels(self.name, method, outcome).observe(time.perf_counter() - started)
+                started = None
+                if is_failure(response):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                yield response
+        except httpx.RequestError:
+            self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            self.breaker.release()
+            raise
+        finally:
+            # Streams are timed to the response headers; the body is the caller's pace
+            self._leave(method, outcome, started)
+            if span is not None:
+                span.error = outcome in ("error", "cancelled", "5xx")
+                span.finish()
+
+    def _traced(self, span: Optional[Span], url: str, kwargs: dict) -> dict:
+        # Each attempt is its own client span, so retries and hedges show up side by side
+        if span is None:
+            return kwargs
+        span.attributes["peer.service"] = self.name
+        span.attributes["http.url"] = url
+        return {**kwargs, "headers": inject(kwargs.get("headers"), span)}
+
+    def _enter(self):
+        self.in_flight += 1
+        self.total_requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        DOWNSTREAM_IN_FLIGHT.labels(self.name).inc()
+
+    def _leave(self, method: str, outcome: str, started: Optional[float]):
+        self.in_flight -= 1
+        DOWNSTREAM_IN_FLIGHT.labels(self.name).dec()
+        if started is not None:
+            DOWNSTREAM_SECONDS.labels(self.name, method, outcome).observe(time.perf_counter() - started)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    def pool_stats(self) -> dict:
+        # httpcore keeps its pool on the transport; fall back to zeros if that changes
+        pool = getattr(self._client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        active = len(connections) - idle
+        return {
+            "baseUrl": self.base_url,
+            "http2": HTTP2_ENABLED,
+            "maxConnections": self.max_connections,
+            "connections": len(connections),
+            "activeConnections": active,
+            "idleConnections": idle,
+            "inFlight": self.in_flight,
+            "peakInFlight": self.peak_in_flight,
+            "queued": max(0, self.in_flight - active),
+            "saturation": round(active / self.max_connections, 3) if self.max_connections else 0.0,
+            "totalRequests": self.total_requests
+        }
+
+    def resilience_stats(self) -> dict:
+        return {
+            "breaker": self.breaker.stats(),
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "retryBudget": self.retry_budget.stats()
+        }
+
+    def singleflight_stats(self) -> dict:
+        return self.singleflight.stats() if self.singleflight else {"enabled": False}
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+def _timeout_for(prefix: str) -> httpx.Timeout:
+    timeout = float(os.getenv(f"{prefix}_TIMEOUT", "5"))
+    connect_timeout = float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", "1"))
+    read_timeout = float(os.getenv(f"{prefix}_READ_TIMEOUT", str(timeout)))
+    return httpx.Timeout(timeout, connect=connect_timeout, read=read_timeout)
+
+
+class DownstreamClients:
+    def __init__(self):
+        self._clients: dict[str, ServiceClient] = {}
+
+    def start(self):
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+        for name, (prefix, default_url, coalesce) in SERVICES.items():
+            base_url = os.getenv(f"{prefix}_URL", default_url)
+            coalesce = os.getenv(f"{prefix}_SINGLEFLIGHT", str(coalesce)).lower() == "true"
+            self._clients[name] = ServiceClient(
+                name, base_url, _timeout_for(prefix), limits, policy_for(prefix), build_retry_budget(),
+                SingleFlight(SINGLEFLIGHT_MAX_WAITERS) if coalesce else None
+            )
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    @property
+    def cars(self) -> ServiceClient:
+        return self._clients["cars"]
+
+    @property
+    def rental(self) -> ServiceClient:
+        return self._clients["rental"]
+
+    @property
+    def payment(self) -> ServiceClient:
+        return self._clients["payment"]
+
+    def pool_stats(self) -> dict:
+        return {name: client.pool_stats() for name, client in self._clients.items()}
+
+    def resilience_stats(self) -> dict:
+        return {name: client.resilience_stats() for name, client in self._clients.items()}
+
+    def singleflight_stats(self) -> dict:
+        return {name: client.singleflight_stats() for name, client in self._clients.items()}
+
+
+downstream = DownstreamClients()
@@ -0,0 +1,33 @@
+import os
+import shutil
+
+# Production server: gunicorn supervises uvicorn workers, which pick uvloop and httptools when installed
+bind = os.getenv("BIND", "0.0.0.0:8080")
+worker_class = "uvicorn.workers.UvicornWorker"
+# sched_getaffinity follows the container's cpuset, cpu_count would report the host's cores
+workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
+
+# The app is imported once in the master and shared copy-on-write; pools and clients
+# are only opened in each worker's lifespan, after the fork
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# On SIGTERM workers stop accepting and get this long to finish in-flight requests
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Workers write metric samples to files in this directory so /manage/metrics on any of
+# them reports the whole container; it has to be set before prometheus_client is imported
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's; the preloaded master has not written any
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response
+
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", os.getenv("SAGA_DB_PATH", "saga.db"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# How long a worker may run a keyed request before another worker may take the key over
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+IDEMPOTENCY_POLL_SECONDS = float(os.getenv("IDEMPOTENCY_POLL_SECONDS", "0.05"))
+PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "60"))
+MAX_KEY_LENGTH = 255
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_key (
+    key         TEXT PRIMARY KEY,
+    fingerprint BLOB NOT NULL,
+    status_code INTEGER,
+    body        BLOB,
+    expires_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_idempotency_key_expires ON idempotency_key (expires_at);
+"""
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: bytes
+    status_code: Optional[int]
+    body: Optional[bytes]
+
+
+def fingerprint(payload: Any) -> bytes:
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).digest()[:16]
+
+
+class IdempotencyLog:
+    """Keys and their responses in SQLite next to the saga log, so every gateway worker sees every key."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def claim(self, key: str, request_fingerprint: bytes) -> Optional[StoredResponse]:
+        # None when the caller now holds the key and runs the request, else what the key already holds:
+        # a finished response, or an empty one while another worker's lease runs
+        now = time.time()
+
+        def work(conn):
+            row = conn.execute(
+                "SELECT fingerprint, status_code, body, expires_at FROM idempotency_key WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[3] > now:
+                return StoredResponse(row[0], row[1], row[2])
+            # New, expired, or abandoned by a worker that died mid-request
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency_key (key, fingerprint, status_code, body, expires_at) "
+                "VALUES (?, ?, NULL, NULL, ?)",
+                (key, request_fingerprint, now + IDEMPOTENCY_LEASE_SECONDS)
+            )
+            return None
+
+        return self._transaction(work)
+
+    def complete(self, key: str, status_code: int, body: bytes):
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE idempotency_key SET status_code = ?, body = ?, expires_at = ? WHERE key = ?",
+            (status_code, body, time.time() + IDEMPOTENCY_TTL, key)
+        ))
+
+    def release(self, key: str):
+        self._transaction(lambda conn: conn.execute(
+            "DELETE FROM idempotency_key WHERE key = ? AND status_code IS NULL", (key,)
+        ))
+
+    def purge(self) -> int:
+        return self._transaction(lambda conn: conn.execute(
+            "DELETE FROM idempotency_key WHERE expires_at <= ?", (time.time(),)
+        ).rowcount)
+
+    def counts(self) -> dict:
+        with self._lock:
+            entries, in_flight = self._conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(status_code) FROM idempotency_key"
+            ).fetchone()
+        return {"entries": entries, "inFlight": in_flight}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IdempotencyStore:
+    """Finished responses by key. A duplicate that arrives while the key is running waits for its response,
+    whichever worker runs it."""
+
+    def __init__(self):
+        self.replays = 0
+        self.coalesced = 0
+        self._log: Optional[IdempotencyLog] = None
+        self._last_purge = 0.0
+
+    async def start(self):
+        self._log = await asyncio.to_thread(IdempotencyLog, IDEMPOTENCY_DB_PATH)
+
+    def close(self):
+        if self._log:
+            self._log.close()
+
+    def _replay(self, stored: StoredResponse, request_fingerprint: bytes) -> Response:
+        if stored.fingerprint != request_fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        self.replays += 1
+        return Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    async def _store(self, key: str, status_code: int, content: Any) -> ORJSONResponse:
+        response = ORJSONResponse(content=jsonable_encoder(content), status_code=status_code)
+        await asyncio.to_thread(self._log.complete, key, status_code, response.body)
+        return response
+
+    async def _purge(self):
+        # Expired keys are swept on the way, at most once per interval in each worker
+        if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = time.monotonic()
+            await asyncio.to_thread(self._log.purge)
+
+    async def run(self, key: str, request_fingerprint: bytes, execute: Callable[[], Awaitable[Any]]) -> Response:
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+        await self._purge()
+        waited = False
+        while True:
+            stored = await asyncio.to_thread(self._log.claim, key, request_fingerprint)
+            if stored is None:
+                break
+            if stored.status_code is not None:
+                return self._replay(stored, request_fingerprint)
+            if stored.fingerprint != request_fingerprint:
+                raise HTTPException(
+                    status_code=422, detail="Idempotency-Key was already used with a different request"
+                )
+            # Another request holds the key: wait for its response, or take over if it failed or its lease lapses
+            if not waited:
+                self.coalesced += 1
+                waited = True
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+        try:
+            result = await execute()
+        except HTTPException as error:
+            if error.status_code >= 500:
+                # 5xx outcomes are not stored, so the client's next retry executes again
+                await asyncio.to_thread(self._log.release, key)
+                raise
+            return await self._store(key, error.status_code, {"detail": error.detail})
+        except BaseException:
+            await asyncio.shield(asyncio.to_thread(self._log.release, key))
+            raise
+        return await self._store(key, 200, result)
+
+    def stats(self) -> dict:
+        stats = self._log.counts() if self._log else {}
+        stats.update(replays=self.replays, coalesced=self.coalesced)
+        return stats
+
+
+idempotency_store = IdempotencyStore()
@@ -1,166 +1,554 @@
-from fastapi import FastAPI, Header, HTTPException, Query
-from typing import Optional, List
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Iterable, Optional, List
+import asyncio
 import httpx
+import orjson
 import uvicorn
-from datetime import datetime
+from datetime import date, datetime
 import os
-
+import uuid
+
+from admission import AdmissionMiddleware
+from cache import car_cache, catalog_cache, etag_matches
+from clients import ServiceClient, downstream
+from readiness import readiness
+from resilience import CircuitOpenError
+from idempotency import fingerprint, idempotency_store
+from metrics import MetricsMiddleware, metrics_response
+from saga import ON_ABORT, ON_COMMIT, SagaStep, sagas
 from schemas import (
     PaginationResponse, RentalResponse, CreateRentalRequest,
-    CreateRentalResponse, CarInfo, PaymentInfo, ErrorResponse
+    CreateRentalResponse, ErrorResponse
 )
+from tracing import TracingMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    downstream.start()
+    await sagas.start()
+    await idempotency_store.start()
+    yield
+    idempotency_store.close()
+    await sagas.stop()
+    await downstream.aclose()
+
+
+app = FastAPI(title="Gateway Service", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(AdmissionMiddleware)
+
+
+@app.exception_handler(httpx.TransportError)
+async def downstream_unavailable(request: Request, error: httpx.TransportError):
+    # Timeouts, refused connections and open breakers that no fallback covered
+    return ORJSONResponse(status_code=503, content={"detail": "Downstream service unavailable"})
+
+FANOUT_CONCURRENCY = int(os.getenv("GATEWAY_FANOUT_CONCURRENCY", "16"))
+# The cars and payment batch endpoints reject more UIDs than this with a 422
+DOWNSTREAM_MAX_BATCH_SIZE = 100
+BATCH_SIZE = min(int(os.getenv("GATEWAY_BATCH_SIZE", "100")), DOWNSTREAM_MAX_BATCH_SIZE)
+
+
+async def fetch_many(client: ServiceClient, path: str, uids: Iterable[str]) -> dict[str, dict]:
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+    async def fetch(uid: str):
+        try:
+            async with semaphore:
+                response = await client.get(path.format(uid))
+        except httpx.TransportError:
+            return uid, {}
+        return uid, orjson.loads(response.content) if response.status_code == 200 else {}
+
+    return dict(await asyncio.gather(*(fetch(uid) for uid in uids)))
+
+
+async def fetch_batch(
+    client: ServiceClient,
+    batch_path: str,
+    field: str,
+    item_path: str,
+    uids: Iterable[str]
+) -> dict[str, dict]:
+    uids = list(uids)
+    chunks = [uids[i:i + BATCH_SIZE] for i in range(0, len(uids), BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+    async def fetch(chunk: list[str]) -> dict[str, dict]:
+        result = {uid: {} for uid in chunk}
+        try:
+            async with semaphore:
+                # Batch lookups only read, so they are as safe to retry as a GET
+                response = await client.post(batch_path, json={field: chunk}, retryable=True)
+        except httpx.TransportError:
+            return result
+        if response.status_code in (404, 405):
+            # Downstream without the bulk endpoint yet
+            return await fetch_many(client, item_path, chunk)
+        if response.status_code == 200:
+            result.update(orjson.loads(response.content)["items"])
+        return result
 
-app = FastAPI(title="Gateway Service")
-
-CARS_SERVICE_URL = os.getenv("CARS_SERVICE_URL", "http://cars:8070")
-RENTAL_SERVICE_URL = os.getenv("RENTAL_SERVICE_URL", "http://rental:8060")
-PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://payment:8050")
-
-
+    result = {}
+    for chunk_result in await asyncio.gather(*(fetch(chunk) for chunk in chunks)):
+        result.update(chunk_result)
+    return result
+
+
+CAR_INFO_FIELDS = ("carUid", "brand", "model", "registrationNumber")
+
+
+async def get_car_infos(car_uids: Iterable[str]) -> dict[str, dict]:
+    car_uids = list(car_uids)
+    cars = await car_cache.get_many(car_uids)
+    missing = [car_uid for car_uid in car_uids if car_uid not in cars]
+    if missing:
+        fetched = await fetch_batch(downstream.cars, "/api/v1/cars/batch", "carUids", "/api/v1/cars/{}", missing)
+        for car_uid, car_data in fetched.items():
+            # Only the immutable attributes are cached, price and availability are always read fresh
+            car_info = {field: car_data[field] for field in CAR_INFO_FIELDS} if car_data else {}
+            if car_info:
+                await car_cache.set(car_uid, car_info)
+            cars[car_uid] = car_info
+    return cars
+
+
+async def revalidating_get(client: ServiceClient, path: str, params: Optional[dict] = None) -> tuple[int, Optional[dict]]:
+    key = f"{client.name}:{path}?{httpx.QueryParams(params)}"
+    cached = await catalog_cache.get(key)
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
+    response = await client.get(path, params=params, headers=headers)
+    if response.status_code == 304 and cached:
+        await catalog_cache.set(key, cached)
+        return 200, cached
+    if response.status_code != 200:
+        return response.status_code, None
+
+    # The body is kept as bytes: pages are relayed untouched, only callers that need a field parse it
+    entry = {
+        "etag": response.headers.get("ETag"),
+        "cacheControl": response.headers.get("Cache-Control"),
+        "body": response.content
+    }
+    if entry["etag"]:
+        await catalog_cache.set(key, entry)
+    return 200, entry
+
+
+def conditional_response(entry: dict, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": entry["etag"], "Cache-Control": entry["cacheControl"]}
+    headers = {name: value for name, value in headers.items() if value}
+    if entry["etag"] and etag_matches(if_none_match, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+async def reserve_car(car_uid: str, booking: dict):
+    response = await downstream.cars.post(f"/api/v1/cars/{car_uid}/reserve", json=booking)
+    await car_cache.delete(car_uid)
+    return response
+
+
+async def release_booking(car_uid: str, booking: dict):
+    response = await downstream.cars.delete(f"/api/v1/cars/{car_uid}/bookings", params=booking)
+    await car_cache.delete(car_uid)
+    return response
+
+
+async def set_car_availability(car_uid: str, available: bool):
+    response = await downstream.cars.patch(
+        f"/api/v1/cars/{car_uid}/availability",
+        params={"available": available}
+    )
+    await car_cache.delete(car_uid)
+    return response
+
+
+@sagas.action("release_car")
+async def release_car_step(payload: dict):
+    if "dateFrom" in payload:
+        # Undoing a booking attempt names it, so only the booking that attempt made is released
+        booking = {name: payload[name] for name in ("dateFrom", "dateTo", "bookingUid") if name in payload}
+        response = await release_booking(payload["carUid"], booking)
+    else:
+        # Steps logged before bookings carried their dates
+        response = await set_car_availability(payload["carUid"], True)
+    if response.status_code not in (200, 204, 404):
+        raise RuntimeError(f"Cars service answered {response.status_code}")
+
+
+def booking_of(rental: dict) -> dict:
+    booking = {"carUid": rental["carUid"], "dateFrom": rental["dateFrom"], "dateTo": rental["dateTo"]}
+    if rental.get("bookingUid"):
+        booking["bookingUid"] = rental["bookingUid"]
+    return booking
+
+
+def check_in_progress(rental: dict, status: str) -> bool:
+    # False when the rental already has the requested status, so repeating the request changes nothing.
+    # A closed rental no longer holds its dates, so its booking must not be released again
+    if rental["status"] == status:
+        return False
+    if rental["status"] != "IN_PROGRESS":
+        raise HTTPException(status_code=409, detail="Rental is not in progress")
+    return True
+
+
+@sagas.action("cancel_payment")
+async def cancel_payment_step(payload: dict):
+    response = await downstream.payment.delete(f"/api/v1/payment/{payload['paymentUid']}")
+    if response.status_code not in (204, 404):
+        raise RuntimeError(f"Payment service answered {response.status_code}")
+    # Keep the rental read model in step; on failure the whole step is retried, the DELETE is idempotent
+    response = await downstream.rental.put(
+        f"/api/v1/rental/read-model/payment/{payload['paymentUid']}",
+        json={"status": "CANCELED"}
+    )
+    if response.status_code != 204:
+        raise RuntimeError(f"Rental service answered {response.status_code}")
+
+
+@sagas.action("void_payment")
+async def void_payment_step(payload: dict):
+    # Cancels the attempt's payment, or makes sure a payment request still in flight cannot create one
+    response = await downstream.payment.delete(f"/api/v1/payment/keys/{payload['idempotencyKey']}")
+    if response.status_code != 204:
+        raise RuntimeError(f"Payment service answered {response.status_code}")
+
+
+@sagas.resolver("create_rental")
+async def resolve_create_rental(context: dict, steps: list[SagaStep]) -> Optional[bool]:
+    # The booking committed if one of the user's rentals holds the attempt's booking
+    response = await downstream.rental.get("/api/v1/rental", params={"username": context["username"]})
+    if response.status_code != 200:
+        return None
+    rentals = response.json()
+    if "bookingUid" in context:
+        return any(rental.get("bookingUid") == context["bookingUid"] for rental in rentals)
+    # Sagas logged before attempts were named, when the payment was made first
+    payment_uids = {step.payload["paymentUid"] for step in steps if step.action == "cancel_payment"}
+    return any(rental["paymentUid"] in payment_uids for rental in rentals)
+
+
+@sagas.resolver("cancel_rental")
+@sagas.resolver("finish_rental")
+async def resolve_rental_status(context: dict, steps: list[SagaStep]) -> Optional[bool]:
+    response = await downstream.rental.get(
+        f"/api/v1/rental/{context['rentalUid']}",
+        params={"username": context["username"]}
+    )
+    if response.status_code == 404:
+        return False
+    if response.status_code != 200:
+        return None
+    return response.json()["status"] == context["status"]
+
+
+def missing_read_model(rentals: list[dict]) -> tuple[set[str], set[str]]:
+    # Rentals booked before the read model existed still need car and payment lookups
+    car_uids = {rental["carUid"] for rental in rentals if not rental.get("car")}
+    payment_uids = {rental["paymentUid"] for rental in rentals if not rental.get("payment")}
+    return car_uids, payment_uids
+
+
+def build_rental_response(rental: dict, car_data: dict, payment_data: dict) -> dict:
+    # Already in RentalResponse shape; downstream payloads are not re-validated through models
+    return {
+        "rentalUid": rental["rentalUid"],
+        "status": rental["status"],
+        "dateFrom": rental["dateFrom"],
+        "dateTo": rental["dateTo"],
+        "car": {
+            "carUid": car_data.get("carUid", rental["carUid"]),
+            "brand": car_data.get("brand", ""),
+            "model": car_data.get("model", ""),
+            "registrationNumber": car_data.get("registrationNumber", "")
+        },
+        "payment": {
+            "paymentUid": payment_data.get("paymentUid", rental["paymentUid"]),
+            "status": payment_data.get("status", "PAID"),
+            "price": payment_data.get("price", 0)
+        }
+    }
+
+
+@app.get("/manage/metrics")
+def get_metrics():
+    return metrics_response()
+
+
+# Liveness: answers as long as the worker's event loop does, whatever the dependencies say
 @app.get("/manage/health")
 def health_check():
     return {"status": "ok"}
 
 
+@app.get("/manage/ready")
+async def readiness_check():
+    ready, checks = readiness()
+    return ORJSONResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks},
+        status_code=200 if ready else 503
+    )
+
+
+@app.get("/manage/pools")
+def pool_stats():
+    return downstream.pool_stats()
+
+
+@app.get("/manage/breakers")
+def breaker_stats():
+    return downstream.resilience_stats()
+
+
+@app.get("/manage/singleflight")
+def singleflight_stats():
+    return downstream.singleflight_stats()
+
+
+@app.get("/manage/cache")
+def cache_stats():
+    return {"cars": car_cache.stats(), "catalog": catalog_cache.stats()}
+
+
+@app.get("/manage/sagas")
+async def saga_stats():
+    return await asyncio.to_thread(sagas.stats)
+
+
+@app.get("/manage/idempotency")
+async def idempotency_stats():
+    return await asyncio.to_thread(idempotency_store.stats)
+
+
 @app.get("/api/v1/cars", response_model=PaginationResponse)
 async def get_cars(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
-    show_all: bool = Query(False, alias="showAll")
+    show_all: bool = Query(False, alias="showAll"),
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", pattern="^(exact|cached|estimate)$"),
+    date_from: Optional[date] = Query(None, alias="dateFrom"),
+    date_to: Optional[date] = Query(None, alias="dateTo"),
+    if_none_match: Optional[str] = Header(None)
 ):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{CARS_SERVICE_URL}/api/v1/cars",
-            params={"page": page, "size": size, "show_all": show_all}
-        )
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Cars service error")
-        return response.json()
+    params = {"page": page, "size": size, "show_all": show_all, "count": count}
+    if cursor is not None:
+        params["cursor"] = cursor
+    if date_from is not None:
+        params["dateFrom"] = str(date_from)
+    if date_to is not None:
+        params["dateTo"] = str(date_to)
+
+    # An unchanged page costs the cars service one version lookup and a 304
+    status_code, entry = await revalidating_get(downstream.cars, "/api/v1/cars", params)
+    if status_code != 200:
+        raise HTTPException(status_code=status_code, detail="Cars service error")
+    return conditional_response(entry, if_none_match)
 
 
 @app.post("/api/v1/rental", response_model=CreateRentalResponse)
 async def create_rental(
     rental_request: CreateRentalRequest,
-    x_user_name: str = Header(..., alias="X-User-Name")
+    x_user_name: str = Header(..., alias="X-User-Name"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    async with httpx.AsyncClient() as client:
-        # Get car details
-        car_response = await client.get(
-            f"{CARS_SERVICE_URL}/api/v1/cars/{rental_request.car_uid}"
-        )
-        if car_response.status_code != 200:
-            raise HTTPException(status_code=404, detail="Car not found")
-
-        car_data = car_response.json()
-
-        # Calculate rental price
-        date_from = datetime.fromisoformat(rental_request.date_from)
-        date_to = datetime.fromisoformat(rental_request.date_to)
-        days = abs((date_to - date_from).days)
-        total_price = days * car_data["price"]
-
-        # Create payment
-        payment_response = await client.post(
-            f"{PAYMENT_SERVICE_URL}/api/v1/payment",
-            json={"price": total_price}
-        )
-        if payment_response.status_code != 200:
+    if idempotency_key is None:
+        return ORJSONResponse(await book_rental(rental_request, x_user_name))
+    # Keys are per user, so two users picking the same key never see each other's booking
+    return await idempotency_store.run(
+        f"{x_user_name}:{idempotency_key}",
+        fingerprint(rental_request),
+        lambda: book_rental(rental_request, x_user_name)
+    )
+
+
+async def book_rental(rental_request: CreateRentalRequest, x_user_name: str) -> dict:
+    # Get car details
+    status_code, car_entry = await revalidating_get(downstream.cars, f"/api/v1/cars/{rental_request.car_uid}")
+    if status_code == 404:
+        raise HTTPException(status_code=404, detail="Car not found")
+    if status_code != 200:
+        raise HTTPException(status_code=503, detail="Cars service unavailable")
+
+    car_data = orjson.loads(car_entry["body"])
+
+    # Calculate rental price
+    date_from = datetime.fromisoformat(rental_request.date_from)
+    date_to = datetime.fromisoformat(rental_request.date_to)
+    days = abs((date_to - date_from).days)
+    total_price = days * car_data["price"]
+    # One id per booking attempt names both side effects: it is the payment's idempotency key, so
+    # retries of that POST reuse one payment, and it tags the car booking. An attempt that was undone
+    # therefore never hands its canceled payment or released booking to the client's next attempt
+    attempt = str(uuid.uuid4())
+    # The car is booked for these dates only, so other ranges stay bookable
+    booking = {
+        "dateFrom": date_from.date().isoformat(),
+        "dateTo": date_to.date().isoformat(),
+        "bookingUid": attempt
+    }
+
+    # Both compensations are logged before either side effect is sent, so if this worker dies at
+    # any point below, recovery finds them. Each is harmless when its side effect never happened
+    saga = await sagas.begin("create_rental", {"username": x_user_name, "bookingUid": attempt}, [
+        SagaStep("void_payment", {"idempotencyKey": attempt}, ON_ABORT),
+        SagaStep("release_car", {"carUid": str(rental_request.car_uid), **booking}, ON_ABORT)
+    ])
+
+    # Create payment and reserve car concurrently
+    payment_response, reserve_response = await asyncio.gather(
+        downstream.payment.post(
+            "/api/v1/payment", json={"price": total_price}, headers={"Idempotency-Key": attempt}, retryable=True
+        ),
+        reserve_car(str(rental_request.car_uid), booking),
+        return_exceptions=True
+    )
+    payment_ok = isinstance(payment_response, httpx.Response) and payment_response.status_code == 200
+    reserve_ok = isinstance(reserve_response, httpx.Response) and reserve_response.status_code == 200
+
+    if not (payment_ok and reserve_ok):
+        # A side that timed out or lost its connection may still have been applied downstream,
+        # so the abort undoes both whatever their responses said
+        await saga.abort()
+        if not payment_ok:
             raise HTTPException(status_code=500, detail="Payment service error")
+        if isinstance(reserve_response, httpx.Response) and reserve_response.status_code == 409:
+            raise HTTPException(status_code=409, detail="Car is not available")
+        raise HTTPException(status_code=500, detail="Failed to reserve car")
 
-        payment_data = payment_response.json()
+    payment_data = payment_response.json()
 
-        # Reserve car
-        reserve_response = await client.patch(
-            f"{CARS_SERVICE_URL}/api/v1/cars/{rental_request.car_uid}/availability",
-            params={"available": False}
-        )
-        if reserve_response.status_code != 200:
-            # Rollback payment
-            await client.delete(f"{PAYMENT_SERVICE_URL}/api/v1/payment/{payment_data['paymentUid']}")
-            raise HTTPException(status_code=500, detail="Failed to reserve car")
-
-        # Create rental
-        rental_response = await client.post(
-            f"{RENTAL_SERVICE_URL}/api/v1/rental",
+    # Create rental
+    try:
+        rental_response = await downstream.rental.post(
+            "/api/v1/rental",
             json={
                 "username": x_user_name,
                 "paymentUid": payment_data["paymentUid"],
                 "carUid": str(rental_request.car_uid),
                 "dateFrom": rental_request.date_from,
-                "dateTo": rental_request.date_to
+                "dateTo": rental_request.date_to,
+                "bookingUid": attempt,
+                # Copies for the rental read model
+                "car": {field: car_data[field] for field in ("brand", "model", "registrationNumber")},
+                "payment": {"status": payment_data["status"], "price": payment_data["price"]}
             }
         )
-        if rental_response.status_code != 200:
-            # Rollback car availability and payment
-            await client.patch(
-                f"{CARS_SERVICE_URL}/api/v1/cars/{rental_request.car_uid}/availability",
-                params={"available": True}
-            )
-            await client.delete(f"{PAYMENT_SERVICE_URL}/api/v1/payment/{payment_data['paymentUid']}")
-            raise HTTPException(status_code=500, detail="Rental service error")
-
-        rental_data = rental_response.json()
-
-        return CreateRentalResponse(
-            rental_uid=rental_data["rentalUid"],
-            status=rental_data["status"],
-            car_uid=rental_request.car_uid,
-            date_from=rental_request.date_from,
-            date_to=rental_request.date_to,
-            payment=PaymentInfo(
-                payment_uid=payment_data["paymentUid"],
-                status=payment_data["status"],
-                price=payment_data["price"]
-            )
-        )
+    except CircuitOpenError:
+        # Never sent, safe to undo; after a timeout the rental may exist, so recovery decides instead
+        await saga.abort()
+        raise
+    if rental_response.status_code != 200:
+        # Rollback car availability and payment
+        await saga.abort()
+        raise HTTPException(status_code=500, detail="Rental service error")
+    await saga.commit()
+
+    rental_data = rental_response.json()
+
+    return {
+        "rentalUid": rental_data["rentalUid"],
+        "status": rental_data["status"],
+        "carUid": str(rental_request.car_uid),
+        "dateFrom": rental_request.date_from,
+        "dateTo": rental_request.date_to,
+        "payment": {
+            "paymentUid": payment_data["paymentUid"],
+            "status": payment_data["status"],
+            "price": payment_data["price"]
+        }
+    }
 
 
 @app.get("/api/v1/rental", response_model=List[RentalResponse])
-async def get_user_rentals(x_user_name: str = Header(..., alias="X-User-Name")):
-    async with httpx.AsyncClient() as client:
-        # Get all rentals for user
-        rentals_response = await client.get(
-            f"{RENTAL_SERVICE_URL}/api/v1/rental",
-            params={"username": x_user_name}
+async def get_user_rentals(
+    x_user_name: str = Header(..., alias="X-User-Name"),
+    status: Optional[str] = Query(None, pattern="^(IN_PROGRESS|FINISHED|CANCELED)$"),
+    date_from: Optional[date] = Query(None, alias="dateFrom"),
+    date_to: Optional[date] = Query(None, alias="dateTo"),
+    size: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    params = {"username": x_user_name}
+    filters = {"status": status, "dateFrom": date_from, "dateTo": date_to, "size": size, "cursor": cursor}
+    params.update({name: str(value) for name, value in filters.items() if value is not None})
+
+    if format == "ndjson":
+        # Opened before answering, so a failing rental service still gets a proper error status
+        stack = AsyncExitStack()
+        upstream = await stack.enter_async_context(
+            downstream.rental.stream("GET", "/api/v1/rental", params={**params, "format": "ndjson"})
         )
-        if rentals_response.status_code != 200:
-            raise HTTPException(status_code=rentals_response.status_code, detail="Rental service error")
-
-        rentals = rentals_response.json()
-        result = []
-
-        for rental in rentals:
-            # Get car info
-            car_response = await client.get(
-                f"{CARS_SERVICE_URL}/api/v1/cars/{rental['carUid']}"
-            )
-            car_data = car_response.json() if car_response.status_code == 200 else {}
-
-            # Get payment info
-            payment_response = await client.get(
-                f"{PAYMENT_SERVICE_URL}/api/v1/payment/{rental['paymentUid']}"
-            )
-            payment_data = payment_response.json() if payment_response.status_code == 200 else {}
-
-            result.append(RentalResponse(
-                rental_uid=rental["rentalUid"],
-                status=rental["status"],
-                date_from=rental["dateFrom"],
-                date_to=rental["dateTo"],
-                car=CarInfo(
-                    car_uid=car_data.get("carUid", rental["carUid"]),
-                    brand=car_data.get("brand", ""),
-                    model=car_data.get("model", ""),
-                    registration_number=car_data.get("registrationNumber", "")
-                ),
-                payment=PaymentInfo(
-                    payment_uid=payment_data.get("paymentUid", rental["paymentUid"]),
-                    status=payment_data.get("status", "PAID"),
-                    price=payment_data.get("price", 0)
-                )
-            ))
+        if upstream.status_code != 200:
+            await stack.aclose()
+            raise HTTPException(status_code=upstream.status_code, detail="Rental service error")
+        return UpstreamStreamingResponse(stream_rentals(upstream), stack, media_type="application/x-ndjson")
+
+    rentals_response = await downstream.rental.get("/api/v1/rental", params=params)
+    if rentals_response.status_code != 200:
+        raise HTTPException(status_code=rentals_response.status_code, detail="Rental service error")
+    headers = {}
+    if "X-Next-Cursor" in rentals_response.headers:
+        headers["X-Next-Cursor"] = rentals_response.headers["X-Next-Cursor"]
+
+    return ORJSONResponse(await compose_rentals(orjson.loads(rentals_response.content)), headers=headers)
+
+
+async def compose_rentals(rentals: list[dict]) -> list[dict]:
+    # The rental service answers from its read model; only rows without copies need lookups,
+    # one bulk call per service for the distinct UIDs, both services in parallel
+    car_uids, payment_uids = missing_read_model(rentals)
+    cars, payments = await asyncio.gather(
+        get_car_infos(car_uids),
+        fetch_batch(downstream.payment, "/api/v1/payment/batch", "paymentUids", "/api/v1/payment/{}", payment_uids)
+    )
+
+    return [
+        build_rental_response(
+            rental,
+            rental.get("car") or cars[rental["carUid"]],
+            rental.get("payment") or payments[rental["paymentUid"]]
+        )
+        for rental in rentals
+    ]
+
+
+class UpstreamStreamingResponse(StreamingResponse):
+    """Releases the upstream stream once the response is over, even if the client left before the body started."""
+
+    def __init__(self, content: AsyncIterator[bytes], stack: AsyncExitStack, **kwargs):
+        super().__init__(content, **kwargs)
+        self.stack = stack
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.stack.aclose()
+
+
+async def stream_rentals(upstream: httpx.Response) -> AsyncIterator[bytes]:
+    # Rentals are composed one batch-sized chunk at a time, so only a chunk is ever held in memory
+    chunk = []
+    async for line in upstream.aiter_lines():
+        if line:
+            chunk.append(orjson.loads(line))
+        if len(chunk) >= BATCH_SIZE:
+            yield await compose_ndjson(chunk)
+            chunk = []
+    if chunk:
+        yield await compose_ndjson(chunk)
 
-        return result
+
+async def compose_ndjson(rentals: list[dict]) -> bytes:
+    return b"".join(orjson.dumps(rental) + b"\n" for rental in await compose_rentals(rentals))
 
 
 @app.get("/api/v1/rental/{rental_uid}", response_model=RentalResponse)
@@ -168,48 +556,28 @@ async def get_rental(
     rental_uid: str,
     x_user_name: str = Header(..., alias="X-User-Name")
 ):
-    async with httpx.AsyncClient() as client:
-        # Get rental
-        rental_response = await client.get(
-            f"{RENTAL_SERVICE_URL}/api/v1/rental/{rental_uid}",
-            params={"username": x_user_name}
-        )
-        if rental_response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Rental not found")
-        if rental_response.status_code != 200:
-            raise HTTPException(status_code=rental_response.status_code, detail="Rental service error")
-
-        rental = rental_response.json()
-
-        # Get car info
-        car_response = await client.get(
-            f"{CARS_SERVICE_URL}/api/v1/cars/{rental['carUid']}"
-        )
-        car_data = car_response.json() if car_response.status_code == 200 else {}
-
-        # Get payment info
-        payment_response = await client.get(
-            f"{PAYMENT_SERVICE_URL}/api/v1/payment/{rental['paymentUid']}"
-        )
-        payment_data = payment_response.json() if payment_response.status_code == 200 else {}
-
-        return RentalResponse(
-            rental_uid=rental["rentalUid"],
-            status=rental["status"],
-            date_from=rental["dateFrom"],
-            date_to=rental["dateTo"],
-            car=CarInfo(
-                car_uid=car_data.get("carUid", rental["carUid"]),
-                brand=car_data.get("brand", ""),
-                model=car_data.get("model", ""),
-                registration_number=car_data.get("registrationNumber", "")
-            ),
-            payment=PaymentInfo(
-                payment_uid=payment_data.get("paymentUid", rental["paymentUid"]),
-                status=payment_data.get("status", "PAID"),
-                price=payment_data.get("price", 0)
-            )
-        )
+    # Get rental
+    rental_response = await downstream.rental.get(
+        f"/api/v1/rental/{rental_uid}",
+        params={"username": x_user_name}
+    )
+    if rental_response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Rental not found")
+    if rental_response.status_code != 200:
+        raise HTTPException(status_code=rental_response.status_code, detail="Rental service error")
+
+    rental = rental_response.json()
+
+    # Car and payment info are independent, fetch whatever the read model lacks concurrently
+    car_uids, payment_uids = missing_read_model([rental])
+    cars, payments = await asyncio.gather(
+        get_car_infos(car_uids),
+        fetch_many(downstream.payment, "/api/v1/payment/{}", payment_uids)
+    )
+    car_data = rental.get("car") or cars[rental["carUid"]]
+    payment_data = rental.get("payment") or payments[rental["paymentUid"]]
+
+    return ORJSONResponse(build_rental_response(rental, car_data, payment_data))
 
 
 @app.delete("/api/v1/rental/{rental_uid}", status_code=204)
@@ -217,37 +585,42 @@ async def cancel_rental(
     rental_uid: str,
     x_user_name: str = Header(..., alias="X-User-Name")
 ):
-    async with httpx.AsyncClient() as client:
-        # Get rental to get car_uid and payment_uid
-        rental_response = await client.get(
-            f"{RENTAL_SERVICE_URL}/api/v1/rental/{rental_uid}",
-            params={"username": x_user_name}
-        )
-        if rental_response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Rental not found")
-        if rental_response.status_code != 200:
-            raise HTTPException(status_code=rental_response.status_code, detail="Rental service error")
-
-        rental = rental_response.json()
+    # Get rental to get car_uid and payment_uid
+    rental_response = await downstream.rental.get(
+        f"/api/v1/rental/{rental_uid}",
+        params={"username": x_user_name}
+    )
+    if rental_response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Rental not found")
+    if rental_response.status_code != 200:
+        raise HTTPException(status_code=rental_response.status_code, detail="Rental service error")
+
+    rental = rental_response.json()
+    if not check_in_progress(rental, "CANCELED"):
+        return None
 
-        # Cancel rental
-        cancel_response = await client.delete(
-            f"{RENTAL_SERVICE_URL}/api/v1/rental/{rental_uid}",
+    # Car release and payment cancel are logged first and run before responding once the rental is canceled;
+    # if they fail here, the saga worker retries them
+    saga = await sagas.begin("cancel_rental", {"rentalUid": rental_uid, "username": x_user_name, "status": "CANCELED"}, [
+        SagaStep("release_car", booking_of(rental), ON_COMMIT),
+        SagaStep("cancel_payment", {"paymentUid": rental["paymentUid"]}, ON_COMMIT)
+    ])
+
+    # Cancel rental
+    try:
+        cancel_response = await downstream.rental.delete(
+            f"/api/v1/rental/{rental_uid}",
             params={"username": x_user_name}
         )
-        if cancel_response.status_code != 204:
-            raise HTTPException(status_code=cancel_response.status_code, detail="Failed to cancel rental")
-
-        # Release car
-        await client.patch(
-            f"{CARS_SERVICE_URL}/api/v1/cars/{rental['carUid']}/availability",
-            params={"available": True}
-        )
-
-        # Cancel payment
-        await client.delete(f"{PAYMENT_SERVICE_URL}/api/v1/payment/{rental['paymentUid']}")
+    except CircuitOpenError:
+        await saga.abort()
+        raise
+    if cancel_response.status_code != 204:
+        await saga.abort()
+        raise HTTPException(status_code=cancel_response.status_code, detail="Failed to cancel rental")
+    await saga.commit()
 
-        return None
+    return None
 
 
 @app.post("/api/v1/rental/{rental_uid}/finish", status_code=204)
@@ -255,34 +628,39 @@ async def finish_rental(
     rental_uid: str,
     x_user_name: str = Header(..., alias="X-User-Name")
 ):
-    async with httpx.AsyncClient() as client:
-        # Get rental to get car_uid
-        rental_response = await client.get(
-            f"{RENTAL_SERVICE_URL}/api/v1/rental/{rental_uid}",
-            params={"username": x_user_name}
-        )
-        if rental_response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Rental not found")
-        if rental_response.status_code != 200:
-            raise HTTPException(status_code=rental_response.status_code, detail="Rental service error")
+    # Get rental to get car_uid
+    rental_response = await downstream.rental.get(
+        f"/api/v1/rental/{rental_uid}",
+        params={"username": x_user_name}
+    )
+    if rental_response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Rental not found")
+    if rental_response.status_code != 200:
+        raise HTTPException(status_code=rental_response.status_code, detail="Rental service error")
+
+    rental = rental_response.json()
+    if not check_in_progress(rental, "FINISHED"):
+        return None
 
-        rental = rental_response.json()
+    saga = await sagas.begin("finish_rental", {"rentalUid": rental_uid, "username": x_user_name, "status": "FINISHED"}, [
+        SagaStep("release_car", booking_of(rental), ON_COMMIT)
+    ])
 
-        # Finish rental
-        finish_response = await client.post(
-            f"{RENTAL_SERVICE_URL}/api/v1/rental/{rental_uid}/finish",
+    # Finish rental
+    try:
+        finish_response = await downstream.rental.post(
+            f"/api/v1/rental/{rental_uid}/finish",
             params={"username": x_user_name}
         )
-        if finish_response.status_code != 204:
-            raise HTTPException(status_code=finish_response.status_code, detail="Failed to finish rental")
-
-        # Release car
-        await client.patch(
-            f"{CARS_SERVICE_URL}/api/v1/cars/{rental['carUid']}/availability",
-            params={"available": True}
-        )
-
-        return None
+    except CircuitOpenError:
+        await saga.abort()
+        raise
+    if finish_response.status_code != 204:
+        await saga.abort()
+        raise HTTPException(status_code=finish_response.status_code, detail="Failed to finish rental")
+    await saga.commit()
+
+    return None
 
 
 if __name__ == "__main__":
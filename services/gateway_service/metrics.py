@@ -0,0 +1,81 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from starlette.responses import Response
+
+# Set by gunicorn.conf.py before the app is imported; each worker then writes its samples
+# to files in that directory and a scrape of any worker reports all of them
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template", ["method", "route", "status"]
+)
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to handle a request, body included",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being handled", multiprocess_mode="livesum"
+)
+HTTP_REQUESTS_SHED = Counter(
+    "http_requests_shed_total", "Requests turned away with 503 by admission control"
+)
+
+DOWNSTREAM_SECONDS = Histogram(
+    "downstream_request_duration_seconds", "Time to the response headers of one downstream attempt",
+    ["service", "method", "outcome"], buckets=LATENCY_BUCKETS
+)
+DOWNSTREAM_IN_FLIGHT = Gauge(
+    "downstream_requests_in_flight", "Downstream attempts awaiting a response",
+    ["service"], multiprocess_mode="livesum"
+)
+
+
+def outcome_of(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+class MetricsMiddleware:
+    """Counts and times every request under its route template rather than the raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            HTTP_SECONDS.labels(scope["method"], template).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], template, str(status)).inc()
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,16 @@
+from admission import admission
+from clients import downstream
+from resilience import OPEN
+from saga import sagas
+
+
+def readiness() -> tuple[bool, dict]:
+    breakers = {name: stats["breaker"]["state"] for name, stats in downstream.resilience_stats().items()}
+    checks = {
+        # One open breaker degrades a few endpoints and every replica sees the same downstream;
+        # only when all are open does this instance have nothing left to serve
+        "downstream": {"ok": any(state != OPEN for state in breakers.values()), "breakers": breakers},
+        "sagas": {"ok": sagas.running},
+        "admission": {"ok": not admission.saturated, **admission.stats()}
+    }
+    return all(check["ok"] for check in checks.values()), checks
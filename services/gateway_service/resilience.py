@@ -0,0 +1,155 @@
+import os
+import random
+import time
+from dataclasses import dataclass
+
+import httpx
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Statuses worth retrying; other 5xx count against the breaker but are returned as is
+TRANSIENT_STATUSES = {502, 503, 504}
+
+RETRY_BUDGET_RATIO = float(os.getenv("DOWNSTREAM_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("DOWNSTREAM_RETRY_BUDGET_MIN_PER_SECOND", "5"))
+RETRY_BUDGET_BURST = float(os.getenv("DOWNSTREAM_RETRY_BUDGET_BURST", "20"))
+RETRY_BACKOFF_BASE = float(os.getenv("DOWNSTREAM_RETRY_BACKOFF_MS", "50")) / 1000
+RETRY_BACKOFF_MAX = float(os.getenv("DOWNSTREAM_RETRY_BACKOFF_MAX_MS", "1000")) / 1000
+
+
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+
+def is_failure(response: httpx.Response) -> bool:
+    return response.status_code >= 500
+
+
+def is_transient(response: httpx.Response) -> bool:
+    return response.status_code in TRANSIENT_STATUSES
+
+
+def backoff(attempt: int) -> float:
+    # Full jitter, so retries from many requests do not arrive in waves
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+@dataclass
+class ResiliencePolicy:
+    retries: int
+    hedge_after: float
+    failure_threshold: int
+    reset_timeout: float
+    half_open_max_calls: int
+
+
+def policy_for(prefix: str) -> ResiliencePolicy:
+    return ResiliencePolicy(
+        retries=int(os.getenv(f"{prefix}_RETRIES", "2")),
+        # 0 disables hedging; otherwise a second read starts if the first is still running after this long
+        hedge_after=float(os.getenv(f"{prefix}_HEDGE_AFTER_MS", "0")) / 1000,
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", "10")),
+        half_open_max_calls=int(os.getenv(f"{prefix}_BREAKER_HALF_OPEN_CALLS", "1"))
+    )
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a few probes through once the reset timeout passes."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, half_open_max_calls: int):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+        self.consecutive_failures = 0
+        self.probes_in_flight = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.probes_in_flight = 0
+
+    def release(self):
+        # A cancelled probe says nothing about the service, free its slot
+        if self.state == HALF_OPEN and self.probes_in_flight:
+            self.probes_in_flight -= 1
+
+    def stats(self) -> dict:
+        stats = {
+            "state": self.state,
+            "consecutiveFailures": self.consecutive_failures,
+            "failureThreshold": self.failure_threshold,
+            "timesOpened": self.times_opened,
+            "rejected": self.rejected
+        }
+        if self.state == OPEN:
+            stats["retryInSeconds"] = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 3)
+        return stats
+
+
+class RetryBudget:
+    """Token bucket: every request earns a fraction of a retry, plus a small floor per second."""
+
+    def __init__(self, ratio: float, min_per_second: float, burst: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.burst = burst
+        self.tokens = burst
+        self.exhausted = 0
+        self._refilled_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.min_per_second)
+        self._refilled_at = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            self.exhausted += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"tokens": round(self.tokens, 2), "burst": self.burst, "exhausted": self.exhausted}
+
+
+def build_retry_budget() -> RetryBudget:
+    return RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_PER_SECOND, RETRY_BUDGET_BURST)
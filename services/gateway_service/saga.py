@@ -0,0 +1,355 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("gateway.saga")
+
+SAGA_DB_PATH = os.getenv("SAGA_DB_PATH", "saga.db")
+BATCH_SIZE = int(os.getenv("SAGA_BATCH_SIZE", "50"))
+POLL_INTERVAL = float(os.getenv("SAGA_POLL_INTERVAL", "1"))
+LEASE_SECONDS = float(os.getenv("SAGA_LEASE_SECONDS", "30"))
+MAX_ATTEMPTS = int(os.getenv("SAGA_MAX_ATTEMPTS", "10"))
+RETRY_BASE_SECONDS = float(os.getenv("SAGA_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("SAGA_RETRY_MAX_SECONDS", "60"))
+RECOVER_AFTER_SECONDS = float(os.getenv("SAGA_RECOVER_AFTER_SECONDS", "60"))
+# Resolved sagas whose steps all finished are kept this long for inspection, then deleted
+RETENTION_SECONDS = float(os.getenv("SAGA_RETENTION_SECONDS", "86400"))
+PURGE_INTERVAL = float(os.getenv("SAGA_PURGE_INTERVAL", "60"))
+PURGE_BATCH_SIZE = 1000
+
+# A step runs only once its saga reaches the matching outcome
+ON_COMMIT = "commit"
+ON_ABORT = "abort"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS saga (
+    saga_id    TEXT PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    state      TEXT NOT NULL CHECK (state IN ('running', 'committed', 'aborted')),
+    context    TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_saga_state_updated ON saga (state, updated_at);
+
+CREATE TABLE IF NOT EXISTS saga_step (
+    step_id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    saga_id         TEXT    NOT NULL REFERENCES saga (saga_id),
+    action          TEXT    NOT NULL,
+    payload         TEXT    NOT NULL,
+    run_on          TEXT    NOT NULL CHECK (run_on IN ('commit', 'abort')),
+    status          TEXT    NOT NULL CHECK (status IN ('armed', 'pending', 'done', 'skipped', 'failed')),
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL    NOT NULL DEFAULT 0,
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_saga_step_due ON saga_step (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS ix_saga_step_saga ON saga_step (saga_id);
+"""
+
+
+@dataclass
+class SagaStep:
+    action: str
+    payload: dict
+    run_on: str = ON_COMMIT
+
+
+@dataclass
+class ClaimedStep:
+    step_id: int
+    action: str
+    payload: dict
+    attempts: int
+
+
+class SagaLog:
+    """Step log in SQLite. Writes are short transactions, shared safely by several workers on one file."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def begin(self, saga_id: str, kind: str, context: dict, steps: list[SagaStep]):
+        now = time.time()
+
+        def work(conn):
+            conn.execute(
+                "INSERT INTO saga (saga_id, kind, state, context, created_at, updated_at) VALUES (?, ?, 'running', ?, ?, ?)",
+                (saga_id, kind, json.dumps(context), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO saga_step (saga_id, action, payload, run_on, status) VALUES (?, ?, ?, ?, 'armed')",
+                [(saga_id, step.action, json.dumps(step.payload), step.run_on) for step in steps]
+            )
+
+        self._transaction(work)
+
+    def resolve(self, saga_id: str, committed: bool) -> list[ClaimedStep]:
+        state, run_on = ("committed", ON_COMMIT) if committed else ("aborted", ON_ABORT)
+        now = time.time()
+
+        def work(conn):
+            updated = conn.execute(
+                "UPDATE saga SET state = ?, updated_at = ? WHERE saga_id = ? AND state = 'running'",
+                (state, now, saga_id)
+            ).rowcount
+            if not updated:
+                return []
+            conn.execute(
+                "UPDATE saga_step SET status = 'skipped' WHERE saga_id = ? AND status = 'armed' AND run_on != ?",
+                (saga_id, run_on)
+            )
+            rows = conn.execute(
+                "SELECT step_id, action, payload FROM saga_step WHERE saga_id = ? AND status = 'armed' AND run_on = ?",
+                (saga_id, run_on)
+            ).fetchall()
+            # Released steps are leased to the caller, which runs them straight away; the worker
+            # only gets them back if that run fails or the lease lapses
+            conn.executemany(
+                "UPDATE saga_step SET status = 'pending', attempts = 1, next_attempt_at = ? WHERE step_id = ?",
+                [(now + LEASE_SECONDS, row[0]) for row in rows]
+            )
+            return [ClaimedStep(row[0], row[1], json.loads(row[2]), 1) for row in rows]
+
+        return self._transaction(work)
+
+    def claim_due(self, limit: int) -> list[ClaimedStep]:
+        now = time.time()
+
+        def work(conn):
+            rows = conn.execute(
+                "SELECT step_id, action, payload, attempts FROM saga_step "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            # The lease keeps other workers off these steps; it lapses if this worker dies mid-batch
+            conn.executemany(
+                "UPDATE saga_step SET attempts = attempts + 1, next_attempt_at = ? WHERE step_id = ?",
+                [(now + LEASE_SECONDS, row[0]) for row in rows]
+            )
+            return [ClaimedStep(row[0], row[1], json.loads(row[2]), row[3] + 1) for row in rows]
+
+        return self._transaction(work)
+
+    def record_results(self, results: list[tuple[ClaimedStep, Optional[str]]]):
+        now = time.time()
+
+        def work(conn):
+            for step, error in results:
+                if error is None:
+                    conn.execute("UPDATE saga_step SET status = 'done', last_error = NULL WHERE step_id = ?",
+                                 (step.step_id,))
+                elif step.attempts >= MAX_ATTEMPTS:
+                    conn.execute("UPDATE saga_step SET status = 'failed', last_error = ? WHERE step_id = ?",
+                                 (error, step.step_id))
+                else:
+                    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (step.attempts - 1))
+                    conn.execute(
+                        "UPDATE saga_step SET next_attempt_at = ?, last_error = ? WHERE step_id = ?",
+                        (now + random.uniform(delay / 2, delay), error, step.step_id)
+                    )
+
+        self._transaction(work)
+
+    def stale_sagas(self, older_than: float) -> list[tuple[str, str, dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT saga_id, kind, context FROM saga WHERE state = 'running' AND updated_at < ? LIMIT ?",
+                (older_than, BATCH_SIZE)
+            ).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def touch(self, saga_id: str):
+        # Unresolved sagas go to the back of the recovery queue
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE saga SET updated_at = ? WHERE saga_id = ?", (time.time(), saga_id)
+        ))
+
+    def armed_steps(self, saga_id: str) -> list[SagaStep]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT action, payload, run_on FROM saga_step WHERE saga_id = ? AND status = 'armed'",
+                (saga_id,)
+            ).fetchall()
+        return [SagaStep(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def purge(self, older_than: float) -> int:
+        def work(conn):
+            # Failed steps keep their saga around until someone looks at them
+            saga_ids = conn.execute(
+                "SELECT saga_id FROM saga WHERE state IN ('committed', 'aborted') AND updated_at < ? "
+                "AND NOT EXISTS (SELECT 1 FROM saga_step WHERE saga_step.saga_id = saga.saga_id "
+                "AND saga_step.status NOT IN ('done', 'skipped')) LIMIT ?",
+                (older_than, PURGE_BATCH_SIZE)
+            ).fetchall()
+            conn.executemany("DELETE FROM saga_step WHERE saga_id = ?", saga_ids)
+            conn.executemany("DELETE FROM saga WHERE saga_id = ?", saga_ids)
+            return len(saga_ids)
+
+        return self._transaction(work)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sagas = dict(self._conn.execute("SELECT state, COUNT(*) FROM saga GROUP BY state").fetchall())
+            steps = dict(self._conn.execute("SELECT status, COUNT(*) FROM saga_step GROUP BY status").fetchall())
+        return {"sagas": sagas, "steps": steps}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+Action = Callable[[dict], Awaitable[None]]
+# Decides the outcome of a saga whose gateway died mid-flow: True commit, False abort, None ask again later
+Resolver = Callable[[dict, list[SagaStep]], Awaitable[Optional[bool]]]
+
+
+class Saga:
+    def __init__(self, coordinator: "SagaCoordinator", saga_id: str):
+        self.coordinator = coordinator
+        self.saga_id = saga_id
+
+    async def commit(self) -> bool:
+        return await self.coordinator.resolve(self.saga_id, committed=True)
+
+    async def abort(self) -> bool:
+        return await self.coordinator.resolve(self.saga_id, committed=False)
+
+
+class SagaCoordinator:
+    def __init__(self):
+        self.actions: dict[str, Action] = {}
+        self.resolvers: dict[str, Resolver] = {}
+        self._log: Optional[SagaLog] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def action(self, name: str):
+        def register(func: Action) -> Action:
+            self.actions[name] = func
+            return func
+        return register
+
+    def resolver(self, kind: str):
+        def register(func: Resolver) -> Resolver:
+            self.resolvers[kind] = func
+            return func
+        return register
+
+    async def start(self):
+        self._log = await asyncio.to_thread(SagaLog, SAGA_DB_PATH)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        if self._log:
+            self._log.close()
+
+    async def begin(self, kind: str, context: dict, steps: list[SagaStep]) -> Saga:
+        saga_id = str(uuid.uuid4())
+        await asyncio.to_thread(self._log.begin, saga_id, kind, context, steps)
+        return Saga(self, saga_id)
+
+    async def resolve(self, saga_id: str, committed: bool) -> bool:
+        # Follow-up steps run here, before the caller answers, so its client reads their effects.
+        # The log is the crash recovery: failed steps are retried by the worker. True if all succeeded
+        steps = await asyncio.to_thread(self._log.resolve, saga_id, committed)
+        return await self._run_steps(steps)
+
+    @property
+    def running(self) -> bool:
+        return self._log is not None and self._worker is not None and not self._worker.done()
+
+    def stats(self) -> dict:
+        return self._log.stats() if self._log else {}
+
+    async def _run(self):
+        last_recovery = last_purge = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_recovery > RECOVER_AFTER_SECONDS / 2:
+                    last_recovery = time.monotonic()
+                    await self._recover()
+                if time.monotonic() - last_purge > PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    # Batches keep each write transaction short for the other workers on the file
+                    while await asyncio.to_thread(self._log.purge, time.time() - RETENTION_SECONDS) == PURGE_BATCH_SIZE:
+                        pass
+                while await self._drain_once() == BATCH_SIZE:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Saga worker iteration failed")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _drain_once(self) -> int:
+        steps = await asyncio.to_thread(self._log.claim_due, BATCH_SIZE)
+        await self._run_steps(steps)
+        return len(steps)
+
+    async def _run_steps(self, steps: list[ClaimedStep]) -> bool:
+        if not steps:
+            return True
+        errors = await asyncio.gather(*(self._execute(step) for step in steps))
+        await asyncio.to_thread(self._log.record_results, list(zip(steps, errors)))
+        return all(error is None for error in errors)
+
+    async def _execute(self, step: ClaimedStep) -> Optional[str]:
+        action = self.actions.get(step.action)
+        if action is None:
+            return f"Unknown action {step.action}"
+        try:
+            await action(step.payload)
+        except Exception as error:
+            logger.warning("Saga step %s (%s) failed: %r", step.step_id, step.action, error)
+            return repr(error)
+        return None
+
+    async def _recover(self):
+        stale = await asyncio.to_thread(self._log.stale_sagas, time.time() - RECOVER_AFTER_SECONDS)
+        for saga_id, kind, context in stale:
+            resolver = self.resolvers.get(kind)
+            outcome = None
+            if resolver is not None:
+                steps = await asyncio.to_thread(self._log.armed_steps, saga_id)
+                try:
+                    outcome = await resolver(context, steps)
+                except Exception:
+                    logger.exception("Saga %s (%s) recovery probe failed", saga_id, kind)
+            if outcome is None:
+                await asyncio.to_thread(self._log.touch, saga_id)
+                continue
+            logger.info("Recovered saga %s (%s): %s", saga_id, kind, "commit" if outcome else "abort")
+            await self.resolve(saga_id, committed=outcome)
+
+
+sagas = SagaCoordinator()
@@ -21,6 +21,7 @@ class PaginationResponse(BaseModel):
     page: int
     page_size: int = Field(validation_alias="pageSize", serialization_alias="pageSize")
     total_elements: int = Field(validation_alias="totalElements", serialization_alias="totalElements")
+    next_cursor: Optional[str] = Field(None, validation_alias="nextCursor", serialization_alias="nextCursor")
     items: list[CarResponse]
 
     class Config:
@@ -0,0 +1,65 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Hashable
+
+SINGLEFLIGHT_MAX_WAITERS = int(os.getenv("SINGLEFLIGHT_MAX_WAITERS", "1000"))
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+def _consume_exception(task: asyncio.Task):
+    # Every waiter may have gone away before the shared call failed
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution and its result."""
+
+    def __init__(self, max_waiters: int):
+        self.max_waiters = max_waiters
+        self.leaders = 0
+        self.shared = 0
+        self.overflow = 0
+        self._calls: dict[Hashable, _Call] = {}
+
+    async def do(self, key: Hashable, execute: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is not None:
+            if call.waiters >= self.max_waiters:
+                # Past the bound a burst goes downstream on its own rather than piling onto one call
+                self.overflow += 1
+                return await execute()
+            call.waiters += 1
+            self.shared += 1
+            return await asyncio.shield(call.task)
+
+        # A separate task, so a caller that disconnects does not cancel the call for the rest
+        task = asyncio.ensure_future(execute())
+        call = self._calls[key] = _Call(task)
+        self.leaders += 1
+
+        def forget(_):
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+        task.add_done_callback(_consume_exception)
+        task.add_done_callback(forget)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        total = self.leaders + self.shared + self.overflow
+        return {
+            "inFlight": len(self._calls),
+            "maxWaiters": self.max_waiters,
+            "executions": self.leaders + self.overflow,
+            "shared": self.shared,
+            "overflow": self.overflow,
+            "collapseRatio": round(self.shared / total, 3) if total else 0.0
+        }
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import PaymentIdempotencyKey
+
+MAX_KEY_LENGTH = 255
+# Far longer than any client retries a request or the gateway takes to settle a booking attempt
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "604800"))
+PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "60"))
+
+
+def fingerprint(payload: Any) -> str:
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def check_key(key: str):
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+
+class IdempotencyKeys:
+    """Keys live in the payment database next to the payments they made, so every worker sees every key."""
+
+    def __init__(self):
+        self.created = 0
+        self.replays = 0
+        self.voided = 0
+        self.expired = 0
+        self._last_purge = 0.0
+
+    async def claim(
+        self,
+        db: AsyncSession,
+        key: str,
+        request_fingerprint: Optional[str],
+        payment_uid: Optional[uuid.UUID]
+    ) -> bool:
+        # False when the key is already taken; a concurrent claim blocks on the key until the other commits.
+        # The failed insert spoils the transaction, so the caller rolls back before reading the winner
+        try:
+            await db.execute(insert(PaymentIdempotencyKey).values(
+                idempotency_key=key, fingerprint=request_fingerprint, payment_uid=payment_uid
+            ))
+        except IntegrityError:
+            return False
+        return True
+
+    def purge_due(self) -> bool:
+        # At most one sweep per interval in each worker
+        if time.monotonic() - self._last_purge < PURGE_INTERVAL:
+            return False
+        self._last_purge = time.monotonic()
+        return True
+
+    async def purge(self, db: AsyncSession):
+        # Once its TTL is over a key has settled: no retry of its request or void of its attempt is still coming
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+        result = await db.execute(
+            delete(PaymentIdempotencyKey)
+            .where(PaymentIdempotencyKey.created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        self.expired += result.rowcount
+
+    def stats(self) -> dict:
+        return {"created": self.created, "replays": self.replays, "voided": self.voided, "expired": self.expired}
+
+
+idempotency_keys = IdempotencyKeys()
@@ -1,52 +1,204 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import FastAPI, Depends, Header, HTTPException
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from typing import List, Optional
 import uvicorn
+import os
 import uuid
 
-from database import engine, get_db, Base
-from models import Payment
-from schemas import PaymentCreate, PaymentResponse
+from admission import AdmissionMiddleware
+from database import dispose_engine, get_db, get_engine, get_read_db, pool_stats, session_scope
+from idempotency import check_key, fingerprint, idempotency_keys
+from metrics import MetricsMiddleware, metrics_response
+from migrations import migrate
+from models import Payment, PaymentIdempotencyKey
+from readiness import readiness
+from schemas import PaymentBatchRequest, PaymentBatchResponse, PaymentCreate, PaymentResponse
+from tracing import TracingMiddleware
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Payment Service")
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Lifespan runs in each worker after the fork, so every worker gets its own pool
+    get_engine()
+    if MIGRATE_ON_STARTUP:
+        await migrate()
+    yield
+    await dispose_engine()
+
+
+app = FastAPI(title="Payment Service", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(AdmissionMiddleware)
+
+# Only what the API returns; rows map straight to JSON without ORM entities or per-row models.
+# Read handlers get plain Row tuples: nothing enters the identity map and nothing is tracked for flush
+PAYMENT_COLUMNS = (Payment.payment_uid, Payment.status, Payment.price)
+
+
+def payment_to_dict(payment) -> dict:
+    # Takes a column row or an entity; the keys are the PaymentResponse aliases
+    return {"paymentUid": str(payment.payment_uid), "status": payment.status, "price": payment.price}
+
+
+@app.get("/manage/metrics")
+def get_metrics():
+    return metrics_response()
+
+
+# Liveness: answers as long as the worker's event loop does, whatever the dependencies say
 @app.get("/manage/health")
 def health_check():
     return {"status": "ok"}
 
 
+@app.get("/manage/ready")
+async def readiness_check():
+    ready, checks = await readiness()
+    return ORJSONResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks},
+        status_code=200 if ready else 503
+    )
+
+
+@app.get("/manage/pool")
+def get_pool_stats():
+    return pool_stats()
+
+
+@app.get("/manage/idempotency")
+def idempotency_stats():
+    return idempotency_keys.stats()
+
+
 @app.post("/api/v1/payment", response_model=PaymentResponse)
-def create_payment(payment: PaymentCreate, db: Session = Depends(get_db)):
+async def create_payment(
+    payment: PaymentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    if idempotency_key is None:
+        async with session_scope() as db:
+            return ORJSONResponse(await insert_payment(db, payment, uuid.uuid4()))
+
+    check_key(idempotency_key)
+    request_fingerprint = fingerprint(payment)
+    async with session_scope() as db:
+        if idempotency_keys.purge_due():
+            await idempotency_keys.purge(db)
+        stored = await keyed_payment(db, idempotency_key)
+        if stored is None:
+            payment_uid = uuid.uuid4()
+            # The key and its payment commit together, so every worker either sees both or neither
+            if await idempotency_keys.claim(db, idempotency_key, request_fingerprint, payment_uid):
+                response = await insert_payment(db, payment, payment_uid)
+                idempotency_keys.created += 1
+                return ORJSONResponse(response)
+            # A concurrent request with the same key committed first
+            await db.rollback()
+            stored = await keyed_payment(db, idempotency_key)
+        return replay(stored, request_fingerprint)
+
+
+async def insert_payment(db: AsyncSession, payment: PaymentCreate, payment_uid: uuid.UUID) -> dict:
     db_payment = Payment(
-        payment_uid=uuid.uuid4(),
+        payment_uid=payment_uid,
         status="PAID",
         price=payment.price
     )
     db.add(db_payment)
-    db.commit()
-    db.refresh(db_payment)
-    return db_payment
+    # Every returned column is set client-side, so no refresh round trip is needed after the commit
+    response = payment_to_dict(db_payment)
+    await db.commit()
+    return response
+
+
+async def keyed_payment(db: AsyncSession, idempotency_key: str):
+    result = await db.execute(
+        select(PaymentIdempotencyKey.fingerprint, *PAYMENT_COLUMNS)
+        .select_from(PaymentIdempotencyKey)
+        .outerjoin(Payment, Payment.payment_uid == PaymentIdempotencyKey.payment_uid)
+        .where(PaymentIdempotencyKey.idempotency_key == idempotency_key)
+    )
+    return result.first()
+
+
+def replay(stored, request_fingerprint: str) -> ORJSONResponse:
+    if stored.payment_uid is None:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was voided before a payment was made")
+    if stored.fingerprint != request_fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    idempotency_keys.replays += 1
+    # The payment as it is now: a key replayed after a cancel reports CANCELED, not the first response's PAID
+    return ORJSONResponse(payment_to_dict(stored), headers={"Idempotent-Replayed": "true"})
+
+
+@app.get("/api/v1/payment/keys/{idempotency_key}", response_model=PaymentResponse)
+async def get_keyed_payment(idempotency_key: str, db: AsyncSession = Depends(get_read_db)):
+    stored = await keyed_payment(db, idempotency_key)
+    if stored is None or stored.payment_uid is None:
+        raise HTTPException(status_code=404, detail="No payment was made with this Idempotency-Key")
+    return ORJSONResponse(payment_to_dict(stored))
+
+
+@app.delete("/api/v1/payment/keys/{idempotency_key}", status_code=204)
+async def void_keyed_payment(idempotency_key: str, db: AsyncSession = Depends(get_db)):
+    check_key(idempotency_key)
+    # Cancels the payment made with the key. With no payment yet the key is taken empty instead,
+    # so a create that is still on its way replays the void and makes no payment
+    if not await idempotency_keys.claim(db, idempotency_key, None, None):
+        await db.rollback()
+        payment_uid = await db.scalar(
+            select(PaymentIdempotencyKey.payment_uid).where(PaymentIdempotencyKey.idempotency_key == idempotency_key)
+        )
+        if payment_uid is not None:
+            await db.execute(
+                update(Payment)
+                .where(Payment.payment_uid == payment_uid)
+                .values(status="CANCELED")
+                .execution_options(synchronize_session=False)
+            )
+    await db.commit()
+    idempotency_keys.voided += 1
+    return None
 
 
 @app.get("/api/v1/payment/{payment_uid}", response_model=PaymentResponse)
-def get_payment(payment_uid: uuid.UUID, db: Session = Depends(get_db)):
-    payment = db.query(Payment).filter(Payment.payment_uid == payment_uid).first()
+async def get_payment(payment_uid: uuid.UUID, db: AsyncSession = Depends(get_read_db)):
+    result = await db.execute(select(*PAYMENT_COLUMNS).where(Payment.payment_uid == payment_uid))
+    payment = result.first()
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
-    return payment
+    return ORJSONResponse(payment_to_dict(payment))
+
+
+@app.post("/api/v1/payment/batch", response_model=PaymentBatchResponse)
+async def get_payments_batch(request: PaymentBatchRequest, db: AsyncSession = Depends(get_read_db)):
+    payment_uids = list(dict.fromkeys(request.payment_uids))
+    # Postgres plans the IN list as a single payment_uid = ANY('{...}') index scan
+    result = await db.execute(select(*PAYMENT_COLUMNS).where(Payment.payment_uid.in_(payment_uids)))
+    items = {row.payment_uid: payment_to_dict(row) for row in result}
+
+    return ORJSONResponse({
+        "items": {str(payment_uid): item for payment_uid, item in items.items()},
+        "missing": [str(payment_uid) for payment_uid in payment_uids if payment_uid not in items]
+    })
 
 
 @app.delete("/api/v1/payment/{payment_uid}", status_code=204)
-def cancel_payment(payment_uid: uuid.UUID, db: Session = Depends(get_db)):
-    payment = db.query(Payment).filter(Payment.payment_uid == payment_uid).first()
+async def cancel_payment(payment_uid: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(Payment).where(Payment.payment_uid == payment_uid))
+    payment = result.scalars().first()
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
 
     payment.status = "CANCELED"
-    db.commit()
+    await db.commit()
     return None
 
 
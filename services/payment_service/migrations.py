@@ -0,0 +1,100 @@
+import asyncio
+
+from sqlalchemy import (CheckConstraint, Column, DateTime, Integer, MetaData, String, Table, Uuid, func, inspect, text)
+from starlette.concurrency import run_in_threadpool
+
+from database import ASYNC_MODE, IS_POSTGRES, get_engine
+
+MIGRATIONS_TABLE = "schema_migrations"
+ADVISORY_LOCK_ID = 70501
+
+# Table definitions are frozen copies: models.py may move on, applied migrations must not
+
+
+def create_payment_table(conn):
+    Table(
+        "payment", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("payment_uid", Uuid(as_uuid=True), nullable=False),
+        Column("status", String(20), nullable=False),
+        Column("price", Integer, nullable=False),
+        CheckConstraint("status IN ('PAID', 'CANCELED')", name="payment_status_check")
+    ).create(conn, checkfirst=True)
+
+
+def create_payment_uid_unique_index(conn):
+    # db-v3.sql declares payment_uid UNIQUE, tables created from the old model did not
+    inspector = inspect(conn)
+    unique_columns = [constraint["column_names"] for constraint in inspector.get_unique_constraints("payment")]
+    unique_columns += [index["column_names"] for index in inspector.get_indexes("payment") if index["unique"]]
+    if ["payment_uid"] not in unique_columns:
+        create_index(
+            conn, "payment", "ix_payment_payment_uid",
+            "CREATE UNIQUE INDEX ix_payment_payment_uid ON payment (payment_uid)"
+        )
+
+
+def create_idempotency_key_table(conn):
+    Table(
+        "payment_idempotency_key", MetaData(),
+        Column("idempotency_key", String(255), primary_key=True),
+        Column("fingerprint", String(32)),
+        Column("payment_uid", Uuid(as_uuid=True)),
+        Column("created_at", DateTime(timezone=True), nullable=False, server_default=func.now())
+    ).create(conn, checkfirst=True)
+
+
+def create_idempotency_key_created_at_index(conn):
+    # Expired keys are swept by age
+    create_index(
+        conn, "payment_idempotency_key", "ix_payment_idempotency_key_created_at",
+        "CREATE INDEX ix_payment_idempotency_key_created_at ON payment_idempotency_key (created_at)"
+    )
+
+
+MIGRATIONS = [
+    ("0001_create_payment", create_payment_table),
+    ("0002_payment_uid_unique", create_payment_uid_unique_index),
+    ("0003_payment_idempotency_key", create_idempotency_key_table),
+    ("0004_payment_idempotency_key_created_at_index", create_idempotency_key_created_at_index),
+]
+
+
+def create_index(conn, table: str, name: str, ddl: str):
+    if name not in {index["name"] for index in inspect(conn).get_indexes(table)}:
+        conn.exec_driver_sql(ddl)
+
+
+def upgrade(conn) -> list[str]:
+    if IS_POSTGRES:
+        # Workers starting together queue here; the lock is released on commit
+        conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({ADVISORY_LOCK_ID})")
+
+    Table(
+        MIGRATIONS_TABLE, MetaData(),
+        Column("version", String(64), primary_key=True),
+        Column("applied_at", DateTime(timezone=True), nullable=False, server_default=func.now())
+    ).create(conn, checkfirst=True)
+
+    applied = set(conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}")).scalars())
+    pending = [(version, migration) for version, migration in MIGRATIONS if version not in applied]
+    for version, migration in pending:
+        migration(conn)
+        conn.execute(text(f"INSERT INTO {MIGRATIONS_TABLE} (version) VALUES (:version)"), {"version": version})
+    return [version for version, _ in pending]
+
+
+async def migrate() -> list[str]:
+    if ASYNC_MODE:
+        async with get_engine().begin() as conn:
+            return await conn.run_sync(upgrade)
+
+    def run():
+        with get_engine().begin() as conn:
+            return upgrade(conn)
+
+    return await run_in_threadpool(run)
+
+
+if __name__ == "__main__":
+    print("Applied:", asyncio.run(migrate()) or "nothing")
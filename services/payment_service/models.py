@@ -1,5 +1,4 @@
-from sqlalchemy import Column, Integer, String, CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, DateTime, Index, Integer, String, CheckConstraint, Uuid, func
 import uuid
 from database import Base
 
@@ -8,7 +7,7 @@ class Payment(Base):
     __tablename__ = "payment"
 
     id = Column(Integer, primary_key=True, index=True)
-    payment_uid = Column(UUID(as_uuid=True), default=uuid.uuid4, nullable=False)
+    payment_uid = Column(Uuid(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False)
     status = Column(String(20), nullable=False)
     price = Column(Integer, nullable=False)
 
@@ -18,3 +17,18 @@ class Payment(Base):
             name="payment_status_check"
         ),
     )
+
+
+class PaymentIdempotencyKey(Base):
+    __tablename__ = "payment_idempotency_key"
+
+    # The primary key is the uniqueness guarantee: concurrent creates with one key serialize on its insert
+    idempotency_key = Column(String(255), primary_key=True)
+    # Both NULL when the key was voided before any payment was made under it
+    fingerprint = Column(String(32))
+    payment_uid = Column(Uuid(as_uuid=True))
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_payment_idempotency_key_created_at", "created_at"),
+    )
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import time
+
+from sqlalchemy import text
+
+from admission import admission
+from database import MAX_OVERFLOW, open_session, pool_stats
+
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "2"))
+READY_TIMEOUT_SECONDS = float(os.getenv("READY_TIMEOUT_SECONDS", "1"))
+READY_MIN_POOL_HEADROOM = int(os.getenv("READY_MIN_POOL_HEADROOM", "1"))
+
+
+class DatabaseProbe:
+    """SELECT 1 through the pool, with the result reused for a few seconds so probes stay cheap."""
+
+    def __init__(self, ttl: float, timeout: float):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.checked_at = 0.0
+        self.result = {"ok": False, "error": "not checked yet"}
+        self._lock = asyncio.Lock()
+
+    async def check(self) -> dict:
+        if time.monotonic() - self.checked_at < self.ttl:
+            return self.result
+        async with self._lock:
+            # Probes that queued behind the one that ran reuse its result
+            if time.monotonic() - self.checked_at < self.ttl:
+                return self.result
+            started = time.perf_counter()
+            try:
+                # Going through the pool means an exhausted pool fails the probe too
+                await asyncio.wait_for(self._ping(), self.timeout)
+                self.result = {"ok": True, "latencySeconds": round(time.perf_counter() - started, 6)}
+            except Exception as error:
+                self.result = {"ok": False, "error": repr(error)}
+            self.checked_at = time.monotonic()
+            return self.result
+
+    async def _ping(self):
+        async with open_session(read_only=True) as db:
+            await db.execute(text("SELECT 1"))
+
+
+database_probe = DatabaseProbe(READY_CACHE_SECONDS, READY_TIMEOUT_SECONDS)
+
+
+def pool_headroom() -> dict:
+    stats = pool_stats()
+    if "checkedOut" not in stats:
+        # Without a pool every session opens its own connection; the database check covers it
+        return {"ok": True}
+    headroom = stats["size"] + MAX_OVERFLOW - stats["checkedOut"]
+    return {"ok": headroom >= READY_MIN_POOL_HEADROOM, "headroom": headroom}
+
+
+async def readiness() -> tuple[bool, dict]:
+    checks = {
+        "database": await database_probe.check(),
+        "pool": pool_headroom(),
+        "admission": {"ok": not admission.saturated, **admission.stats()}
+    }
+    return all(check["ok"] for check in checks.values()), checks
@@ -2,6 +2,8 @@ from pydantic import BaseModel, Field
 from uuid import UUID
 from typing import Literal
 
+MAX_BATCH_SIZE = 100
+
 
 class PaymentBase(BaseModel):
     price: int
@@ -19,3 +21,15 @@ class PaymentResponse(BaseModel):
     class Config:
         from_attributes = True
         populate_by_name = True
+
+
+class PaymentBatchRequest(BaseModel):
+    payment_uids: list[UUID] = Field(validation_alias="paymentUids", min_length=1, max_length=MAX_BATCH_SIZE)
+
+    class Config:
+        populate_by_name = True
+
+
+class PaymentBatchResponse(BaseModel):
+    items: dict[UUID, PaymentResponse]
+    missing: list[UUID]
@@ -0,0 +1,221 @@
+import os
+import re
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+import orjson
+from sqlalchemy import event
+
+# none disables tracing; stdout and file write one OTLP/JSON export request per span and line
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "/tmp/traces.jsonl")
+# Applies to traces started here; a sampled flag in an incoming traceparent is always honoured
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "payment")
+ENABLED = TRACE_EXPORTER != "none"
+
+TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$")
+KINDS = {"internal": 1, "server": 2, "client": 3}
+
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "sampled", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "error")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = {}
+        self.error = False
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            exporter.export(self)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple[str, str, bool]]:
+    match = TRACEPARENT.match(header.strip().lower()) if header else None
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags, rest = match.groups()
+    # Version 00 has exactly four fields; later versions may append more
+    if version == "ff" or (version == "00" and rest) or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def new_span(name: str, kind: str = "internal", remote: Optional[tuple[str, str, bool]] = None) -> Span:
+    parent = current_span.get()
+    if parent is not None:
+        return Span(name, kind, parent.trace_id, parent.span_id, parent.sampled)
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+        return Span(name, kind, trace_id, parent_id, sampled)
+    return Span(name, kind, os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATIO)
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", remote: Optional[tuple[str, str, bool]] = None) -> Iterator[Span]:
+    span = new_span(name, kind, remote)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as error:
+        span.error = True
+        span.attributes["exception.type"] = type(error).__name__
+        raise
+    finally:
+        current_span.reset(token)
+        span.finish()
+
+
+@contextmanager
+def client_span(name: str) -> Iterator[Optional[Span]]:
+    if not ENABLED:
+        yield None
+        return
+    with start_span(name, "client") as span:
+        yield span
+
+
+def inject(headers: Optional[dict], span: Optional[Span]) -> Optional[dict]:
+    if span is None:
+        return headers
+    headers = dict(headers or {})
+    headers["traceparent"] = span.traceparent()
+    return headers
+
+
+def attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Exporter:
+    """Writes finished sampled spans as OTLP/JSON lines, so any OTLP file receiver can load them."""
+
+    def __init__(self, kind: str, path: str):
+        self.kind = kind
+        self.path = path
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]}
+
+    def _target(self) -> int:
+        if self.kind == "stdout":
+            return sys.stdout.fileno()
+        if self._fd is None:
+            # Opened lazily, after the fork; O_APPEND keeps each worker's single-write lines whole
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        return self._fd
+
+    def export(self, span: Span):
+        record = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": KINDS[span.kind],
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": attribute_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2 if span.error else 1}
+        }
+        if span.parent_id:
+            record["parentSpanId"] = span.parent_id
+        line = orjson.dumps({"resourceSpans": [{
+            "resource": self.resource,
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [record]}]
+        }]}) + b"\n"
+        with self._lock:
+            os.write(self._target(), line)
+
+
+exporter = Exporter(TRACE_EXPORTER, TRACE_FILE)
+
+
+class TracingMiddleware:
+    """Opens a server span per request, continuing the caller's trace when it sends a traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        remote = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                remote = parse_traceparent(value.decode("latin-1"))
+                break
+
+        with start_span(scope["method"], "server", remote) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.attributes["http.status_code"] = message["status"]
+                    span.error = message["status"] >= 500
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                template = route.path if route is not None else "unmatched"
+                span.name = f"{scope['method']} {template}"
+                span.attributes["http.method"] = scope["method"]
+                span.attributes["http.route"] = template
+
+
+def trace_engine(engine):
+    if not ENABLED:
+        return
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = current_span.get()
+        # SQL is only traced inside a sampled request; parameters are never recorded
+        span = new_span("SQL", "client") if parent is not None and parent.sampled else None
+        if span is not None:
+            span.name = f"SQL {statement.lstrip().split(None, 1)[0].upper()}" if statement.strip() else "SQL"
+            span.attributes["db.system"] = sync_engine.dialect.name
+            span.attributes["db.statement"] = statement
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = conn.info["trace_spans"].pop()
+        if span is not None:
+            span.finish()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        span = spans.pop() if spans else None
+        if span is not None:
+            span.error = True
+            span.attributes["exception.type"] = type(context.original_exception).__name__
+            span.finish()
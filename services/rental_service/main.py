@@ -1,26 +1,127 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+import orjson
 import uvicorn
+import os
 import uuid
-from datetime import datetime
+from datetime import date, datetime, time
 
-from database import engine, get_db, Base
+from admission import AdmissionMiddleware
+from database import dispose_engine, get_db, get_engine, get_read_db, pool_stats
+from metrics import MetricsMiddleware, metrics_response
+from migrations import migrate
 from models import Rental
-from schemas import RentalCreate, RentalResponse
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_CHUNK_SIZE, decode_cursor, encode_cursor
+from readiness import readiness
+from schemas import RentalCreate, RentalPaymentUpdate, RentalResponse
+from tracing import TracingMiddleware
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Rental Service")
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Lifespan runs in each worker after the fork, so every worker gets its own pool
+    get_engine()
+    if MIGRATE_ON_STARTUP:
+        await migrate()
+    yield
+    await dispose_engine()
+
+
+app = FastAPI(title="Rental Service", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(AdmissionMiddleware)
+
+
+# Only what the API returns (plus id for cursors); rows map straight to JSON without ORM entities or models
+RENTAL_COLUMNS = (
+    Rental.id, Rental.rental_uid, Rental.username, Rental.payment_uid, Rental.car_uid,
+    Rental.date_from, Rental.date_to, Rental.status, Rental.booking_uid,
+    Rental.car_brand, Rental.car_model, Rental.car_registration_number,
+    Rental.payment_status, Rental.payment_price
+)
+
+
+def rental_to_dict(rental) -> dict:
+    # Takes a column row or an entity; the keys are the RentalResponse aliases
+    return {
+        "rentalUid": str(rental.rental_uid),
+        "username": rental.username,
+        "paymentUid": str(rental.payment_uid),
+        "carUid": str(rental.car_uid),
+        "dateFrom": rental.date_from.strftime("%Y-%m-%d"),
+        "dateTo": rental.date_to.strftime("%Y-%m-%d"),
+        "status": rental.status,
+        "bookingUid": str(rental.booking_uid) if rental.booking_uid else None,
+        "car": read_model_car(rental),
+        "payment": read_model_payment(rental)
+    }
+
+
+# Rows booked before the read model existed have no copies; the gateway looks those up itself
+def read_model_car(rental) -> Optional[dict]:
+    if rental.car_brand is None:
+        return None
+    return {
+        "brand": rental.car_brand,
+        "model": rental.car_model,
+        "registrationNumber": rental.car_registration_number
+    }
+
+
+def read_model_payment(rental) -> Optional[dict]:
+    if rental.payment_status is None:
+        return None
+    return {"status": rental.payment_status, "price": rental.payment_price}
+
+
+def user_rental(query, rental_uid: uuid.UUID, username: str):
+    return query.where(Rental.rental_uid == rental_uid, Rental.username == username)
+
+
+async def get_user_rental(db: AsyncSession, rental_uid: uuid.UUID, username: str) -> Rental:
+    result = await db.execute(user_rental(select(Rental), rental_uid, username))
+    rental = result.scalars().first()
+
+    if not rental:
+        raise HTTPException(status_code=404, detail="Rental not found")
+    return rental
+
+
+@app.get("/manage/metrics")
+def get_metrics():
+    return metrics_response()
+
+
+# Liveness: answers as long as the worker's event loop does, whatever the dependencies say
 @app.get("/manage/health")
 def health_check():
     return {"status": "ok"}
 
 
+@app.get("/manage/ready")
+async def readiness_check():
+    ready, checks = await readiness()
+    return ORJSONResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks},
+        status_code=200 if ready else 503
+    )
+
+
+@app.get("/manage/pool")
+def get_pool_stats():
+    return pool_stats()
+
+
 @app.post("/api/v1/rental", response_model=RentalResponse)
-def create_rental(rental: RentalCreate, db: Session = Depends(get_db)):
+async def create_rental(rental: RentalCreate, db: AsyncSession = Depends(get_db)):
     date_from = datetime.fromisoformat(rental.date_from)
     date_to = datetime.fromisoformat(rental.date_to)
 
@@ -31,89 +132,132 @@ def create_rental(rental: RentalCreate, db: Session = Depends(get_db)):
         car_uid=rental.car_uid,
         date_from=date_from,
         date_to=date_to,
-        status="IN_PROGRESS"
+        status="IN_PROGRESS",
+        booking_uid=rental.booking_uid
     )
+    if rental.car is not None:
+        db_rental.car_brand = rental.car.brand
+        db_rental.car_model = rental.car.model
+        db_rental.car_registration_number = rental.car.registration_number
+    if rental.payment is not None:
+        db_rental.payment_status = rental.payment.status
+        db_rental.payment_price = rental.payment.price
     db.add(db_rental)
-    db.commit()
-    db.refresh(db_rental)
-
-    return RentalResponse(
-        rental_uid=db_rental.rental_uid,
-        username=db_rental.username,
-        payment_uid=db_rental.payment_uid,
-        car_uid=db_rental.car_uid,
-        date_from=rental.date_from,
-        date_to=rental.date_to,
-        status=db_rental.status
-    )
+    # Every returned column is set client-side, so no refresh round trip is needed after the commit
+    response = rental_to_dict(db_rental)
+    response.update(dateFrom=rental.date_from, dateTo=rental.date_to)
+    await db.commit()
+    return ORJSONResponse(response)
 
 
 @app.get("/api/v1/rental", response_model=List[RentalResponse])
-def get_rentals_by_username(username: str, db: Session = Depends(get_db)):
-    rentals = db.query(Rental).filter(Rental.username == username).all()
-
-    return [
-        RentalResponse(
-            rental_uid=rental.rental_uid,
-            username=rental.username,
-            payment_uid=rental.payment_uid,
-            car_uid=rental.car_uid,
-            date_from=rental.date_from.strftime("%Y-%m-%d"),
-            date_to=rental.date_to.strftime("%Y-%m-%d"),
-            status=rental.status
-        )
-        for rental in rentals
-    ]
+async def get_rentals_by_username(
+    username: str,
+    status: Optional[str] = Query(None, pattern="^(IN_PROGRESS|FINISHED|CANCELED)$"),
+    date_from: Optional[date] = Query(None, alias="dateFrom"),
+    date_to: Optional[date] = Query(None, alias="dateTo"),
+    size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Car and payment details come from the read model columns, one index scan per page
+    query = select(*RENTAL_COLUMNS).where(Rental.username == username)
+    if status is not None:
+        query = query.where(Rental.status == status)
+    # Rentals overlapping the requested range
+    if date_from is not None:
+        query = query.where(Rental.date_to >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        query = query.where(Rental.date_from <= datetime.combine(date_to, time.min))
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        if last_id is not None:
+            query = query.where(Rental.id > last_id)
+    query = query.order_by(Rental.id)
 
+    if format == "ndjson":
+        if size is not None:
+            query = query.limit(size)
+        return StreamingResponse(stream_rentals(db, query), media_type="application/x-ndjson")
 
-@app.get("/api/v1/rental/{rental_uid}", response_model=RentalResponse)
-def get_rental(rental_uid: uuid.UUID, username: str, db: Session = Depends(get_db)):
-    rental = db.query(Rental).filter(
-        Rental.rental_uid == rental_uid,
-        Rental.username == username
-    ).first()
+    # Without size or cursor the whole history comes back, as before paging existed
+    if size is None and cursor is None:
+        result = await db.execute(query)
+        return ORJSONResponse([rental_to_dict(row) for row in result])
 
-    if not rental:
-        raise HTTPException(status_code=404, detail="Rental not found")
+    size = size or DEFAULT_PAGE_SIZE
+    result = await db.execute(query.limit(size + 1))
+    rows = result.all()
+    headers = {}
+    if len(rows) > size:
+        rows = rows[:size]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].id)
+    return ORJSONResponse([rental_to_dict(row) for row in rows], headers=headers)
 
-    return RentalResponse(
-        rental_uid=rental.rental_uid,
-        username=rental.username,
-        payment_uid=rental.payment_uid,
-        car_uid=rental.car_uid,
-        date_from=rental.date_from.strftime("%Y-%m-%d"),
-        date_to=rental.date_to.strftime("%Y-%m-%d"),
-        status=rental.status
-    )
 
+async def stream_rentals(db: AsyncSession, query) -> AsyncIterator[bytes]:
+    # A server-side cursor hands rows over in chunks, so memory stays flat however long the history is
+    result = await db.stream(query.execution_options(yield_per=STREAM_CHUNK_SIZE))
+    async for rows in result.partitions():
+        yield b"".join(orjson.dumps(rental_to_dict(row)) + b"\n" for row in rows)
 
-@app.delete("/api/v1/rental/{rental_uid}", status_code=204)
-def cancel_rental(rental_uid: uuid.UUID, username: str, db: Session = Depends(get_db)):
-    rental = db.query(Rental).filter(
-        Rental.rental_uid == rental_uid,
-        Rental.username == username
-    ).first()
 
+@app.get("/api/v1/rental/{rental_uid}", response_model=RentalResponse)
+async def get_rental(rental_uid: uuid.UUID, username: str, db: AsyncSession = Depends(get_read_db)):
+    # Entities are only loaded by the handlers that change them
+    result = await db.execute(user_rental(select(*RENTAL_COLUMNS), rental_uid, username))
+    rental = result.first()
     if not rental:
         raise HTTPException(status_code=404, detail="Rental not found")
+    return ORJSONResponse(rental_to_dict(rental))
+
+
+async def close_rental(db: AsyncSession, rental_uid: uuid.UUID, username: str, status: str):
+    # Only a rental in progress still holds its car; closing it twice, or both canceling and finishing it,
+    # would have the gateway release a booking that may belong to the next renter by now
+    result = await db.execute(
+        user_rental(update(Rental), rental_uid, username)
+        .where(Rental.status == "IN_PROGRESS")
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        await get_user_rental(db, rental_uid, username)
+        raise HTTPException(status_code=409, detail="Rental is not in progress")
+    await db.commit()
+
 
-    rental.status = "CANCELED"
-    db.commit()
+@app.delete("/api/v1/rental/{rental_uid}", status_code=204)
+async def cancel_rental(rental_uid: uuid.UUID, username: str, db: AsyncSession = Depends(get_db)):
+    await close_rental(db, rental_uid, username, "CANCELED")
     return None
 
 
 @app.post("/api/v1/rental/{rental_uid}/finish", status_code=204)
-def finish_rental(rental_uid: uuid.UUID, username: str, db: Session = Depends(get_db)):
-    rental = db.query(Rental).filter(
-        Rental.rental_uid == rental_uid,
-        Rental.username == username
-    ).first()
+async def finish_rental(rental_uid: uuid.UUID, username: str, db: AsyncSession = Depends(get_db)):
+    await close_rental(db, rental_uid, username, "FINISHED")
+    return None
 
-    if not rental:
-        raise HTTPException(status_code=404, detail="Rental not found")
 
-    rental.status = "FINISHED"
-    db.commit()
+@app.put("/api/v1/rental/read-model/payment/{payment_uid}", status_code=204)
+async def update_payment_read_model(
+    payment_uid: uuid.UUID,
+    payment: RentalPaymentUpdate,
+    db: AsyncSession = Depends(get_db)
+):
+    # Pushed by the gateway after it changes a payment; unknown payment UIDs are a no-op
+    values = {"payment_status": payment.status}
+    if payment.price is not None:
+        values["payment_price"] = payment.price
+    await db.execute(
+        update(Rental)
+        .where(Rental.payment_uid == payment_uid)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
     return None
 
 
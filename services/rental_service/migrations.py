@@ -0,0 +1,122 @@
+import asyncio
+
+from sqlalchemy import (CheckConstraint, Column, DateTime, Integer, MetaData, String, Table, Uuid, func, inspect, text)
+from starlette.concurrency import run_in_threadpool
+
+from database import ASYNC_MODE, IS_POSTGRES, get_engine
+
+MIGRATIONS_TABLE = "schema_migrations"
+ADVISORY_LOCK_ID = 70601
+
+# Table definitions are frozen copies: models.py may move on, applied migrations must not
+
+
+def create_rental_table(conn):
+    Table(
+        "rental", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("rental_uid", Uuid(as_uuid=True), unique=True, nullable=False),
+        Column("username", String(80), nullable=False),
+        Column("payment_uid", Uuid(as_uuid=True), nullable=False),
+        Column("car_uid", Uuid(as_uuid=True), nullable=False),
+        Column("date_from", DateTime(timezone=True), nullable=False),
+        Column("date_to", DateTime(timezone=True), nullable=False),
+        Column("status", String(20), nullable=False),
+        CheckConstraint("status IN ('IN_PROGRESS', 'FINISHED', 'CANCELED')", name="rental_status_check")
+    ).create(conn, checkfirst=True)
+
+
+def create_username_status_index(conn):
+    # Lookups by (rental_uid, username) already go through the unique rental_uid index
+    create_index(
+        conn, "rental", "ix_rental_username_status",
+        "CREATE INDEX ix_rental_username_status ON rental (username, status)"
+    )
+
+
+def add_read_model_columns(conn):
+    # Car and payment details copied onto the rental, so a user's history is one query on this database
+    add_column(conn, "rental", "car_brand", "ALTER TABLE rental ADD COLUMN car_brand VARCHAR(80)")
+    add_column(conn, "rental", "car_model", "ALTER TABLE rental ADD COLUMN car_model VARCHAR(80)")
+    add_column(
+        conn, "rental", "car_registration_number",
+        "ALTER TABLE rental ADD COLUMN car_registration_number VARCHAR(20)"
+    )
+    add_column(conn, "rental", "payment_status", "ALTER TABLE rental ADD COLUMN payment_status VARCHAR(20)")
+    add_column(conn, "rental", "payment_price", "ALTER TABLE rental ADD COLUMN payment_price INT")
+    # Callbacks update the copies by payment_uid and car_uid
+    create_index(
+        conn, "rental", "ix_rental_payment_uid",
+        "CREATE INDEX ix_rental_payment_uid ON rental (payment_uid)"
+    )
+    create_index(conn, "rental", "ix_rental_car_uid", "CREATE INDEX ix_rental_car_uid ON rental (car_uid)")
+
+
+def create_username_id_index(conn):
+    # History pages walk a user's rentals in id order
+    create_index(
+        conn, "rental", "ix_rental_username_id",
+        "CREATE INDEX ix_rental_username_id ON rental (username, id)"
+    )
+
+
+def add_booking_uid_column(conn):
+    # The cars service releases exactly this booking when the rental is canceled or finished
+    if "booking_uid" not in {column["name"] for column in inspect(conn).get_columns("rental")}:
+        # Rendered per dialect: uuid on Postgres, CHAR(32) on SQLite
+        column_type = Uuid().compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE rental ADD COLUMN booking_uid {column_type}")
+
+
+MIGRATIONS = [
+    ("0001_create_rental", create_rental_table),
+    ("0002_rental_username_status_index", create_username_status_index),
+    ("0003_rental_read_model", add_read_model_columns),
+    ("0004_rental_username_id_index", create_username_id_index),
+    ("0005_rental_booking_uid", add_booking_uid_column),
+]
+
+
+def create_index(conn, table: str, name: str, ddl: str):
+    if name not in {index["name"] for index in inspect(conn).get_indexes(table)}:
+        conn.exec_driver_sql(ddl)
+
+
+def add_column(conn, table: str, name: str, ddl: str):
+    if name not in {column["name"] for column in inspect(conn).get_columns(table)}:
+        conn.exec_driver_sql(ddl)
+
+
+def upgrade(conn) -> list[str]:
+    if IS_POSTGRES:
+        # Workers starting together queue here; the lock is released on commit
+        conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({ADVISORY_LOCK_ID})")
+
+    Table(
+        MIGRATIONS_TABLE, MetaData(),
+        Column("version", String(64), primary_key=True),
+        Column("applied_at", DateTime(timezone=True), nullable=False, server_default=func.now())
+    ).create(conn, checkfirst=True)
+
+    applied = set(conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}")).scalars())
+    pending = [(version, migration) for version, migration in MIGRATIONS if version not in applied]
+    for version, migration in pending:
+        migration(conn)
+        conn.execute(text(f"INSERT INTO {MIGRATIONS_TABLE} (version) VALUES (:version)"), {"version": version})
+    return [version for version, _ in pending]
+
+
+async def migrate() -> list[str]:
+    if ASYNC_MODE:
+        async with get_engine().begin() as conn:
+            return await conn.run_sync(upgrade)
+
+    def run():
+        with get_engine().begin() as conn:
+            return upgrade(conn)
+
+    return await run_in_threadpool(run)
+
+
+if __name__ == "__main__":
+    print("Applied:", asyncio.run(migrate()) or "nothing")
@@ -1,5 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, String, DateTime, CheckConstraint, Index, Uuid
 import uuid
 from database import Base
 
@@ -8,17 +7,29 @@ class Rental(Base):
     __tablename__ = "rental"
 
     id = Column(Integer, primary_key=True, index=True)
-    rental_uid = Column(UUID(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False)
+    rental_uid = Column(Uuid(as_uuid=True), default=uuid.uuid4, unique=True, nullable=False)
     username = Column(String(80), nullable=False)
-    payment_uid = Column(UUID(as_uuid=True), nullable=False)
-    car_uid = Column(UUID(as_uuid=True), nullable=False)
+    payment_uid = Column(Uuid(as_uuid=True), nullable=False)
+    car_uid = Column(Uuid(as_uuid=True), nullable=False)
     date_from = Column(DateTime(timezone=True), nullable=False)
     date_to = Column(DateTime(timezone=True), nullable=False)
     status = Column(String(20), nullable=False)
+    # The car booking this rental holds; NULL for rentals booked before bookings were tagged
+    booking_uid = Column(Uuid(as_uuid=True))
+    # Read model, filled by the gateway at booking time and on payment changes
+    car_brand = Column(String(80))
+    car_model = Column(String(80))
+    car_registration_number = Column(String(20))
+    payment_status = Column(String(20))
+    payment_price = Column(Integer)
 
     __table_args__ = (
         CheckConstraint(
             "status IN ('IN_PROGRESS', 'FINISHED', 'CANCELED')",
             name="rental_status_check"
         ),
+        Index("ix_rental_username_status", "username", "status"),
+        Index("ix_rental_username_id", "username", "id"),
+        Index("ix_rental_payment_uid", "payment_uid"),
+        Index("ix_rental_car_uid", "car_uid"),
     )
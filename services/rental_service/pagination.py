@@ -0,0 +1,27 @@
+import base64
+import binascii
+import json
+import os
+from typing import Optional
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = int(os.getenv("RENTAL_DEFAULT_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = 100
+STREAM_CHUNK_SIZE = int(os.getenv("RENTAL_STREAM_CHUNK_SIZE", "500"))
+
+
+def encode_cursor(last_id: int) -> str:
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[int]:
+    # An empty cursor opts into paging from the first row
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
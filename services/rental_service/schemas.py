@@ -1,7 +1,26 @@
 from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
-from typing import Literal
+from typing import Literal, Optional
+
+
+class RentalCarInfo(BaseModel):
+    brand: str
+    model: str
+    registration_number: str = Field(alias="registrationNumber")
+
+    class Config:
+        populate_by_name = True
+
+
+class RentalPaymentInfo(BaseModel):
+    status: Literal["PAID", "CANCELED"]
+    price: int
+
+
+class RentalPaymentUpdate(BaseModel):
+    status: Literal["PAID", "CANCELED"]
+    price: Optional[int] = None
 
 
 class RentalBase(BaseModel):
@@ -16,7 +35,9 @@ class RentalBase(BaseModel):
 
 
 class RentalCreate(RentalBase):
-    pass
+    booking_uid: Optional[UUID] = Field(None, validation_alias="bookingUid")
+    car: Optional[RentalCarInfo] = None
+    payment: Optional[RentalPaymentInfo] = None
 
 
 class RentalResponse(BaseModel):
@@ -27,6 +48,9 @@ class RentalResponse(BaseModel):
     date_from: str = Field(serialization_alias="dateFrom")
     date_to: str = Field(serialization_alias="dateTo")
     status: Literal["IN_PROGRESS", "FINISHED", "CANCELED"]
+    booking_uid: Optional[UUID] = Field(None, serialization_alias="bookingUid")
+    car: Optional[RentalCarInfo] = None
+    payment: Optional[RentalPaymentInfo] = None
 
     class Config:
         from_attributes = True
@@ -5,6 +5,7 @@ Tests health endpoints and gateway API endpoints
 """
 import pytest
 import requests
+import uuid
 
 BASE_URL = "http://localhost:8080"
 CARS_SERVICE_URL = "http://localhost:8070"
@@ -40,6 +41,98 @@ def test_payment_service_health():
     assert response.status_code == 200
     assert response.json()["status"] == "ok"
 
+def test_readiness():
+    """Test /manage/ready reports dependency checks on the gateway and a database service"""
+    response = requests.get(f"{BASE_URL}/manage/ready")
+    print(f"Gateway readiness: {response.status_code} - {response.json()}")
+    assert response.status_code == 200
+    assert response.json()["checks"]["downstream"]["breakers"]["cars"] == "closed"
+
+    response = requests.get(f"{CARS_SERVICE_URL}/manage/ready")
+    print(f"Cars service readiness: {response.status_code} - {response.json()}")
+    assert response.status_code == 200
+    assert response.json()["checks"]["database"]["ok"] is True
+
+def test_metrics_route_templates():
+    """Test /manage/metrics labels requests by route template, not raw path"""
+    requests.get(f"{BASE_URL}/api/v1/cars?page=1&size=1")
+    response = requests.get(f"{BASE_URL}/manage/metrics")
+    print(f"Gateway metrics: {response.status_code}")
+    assert response.status_code == 200
+    assert 'route="/api/v1/cars"' in response.text
+    assert any(
+        line.startswith("downstream_request_duration_seconds_count{") and 'service="cars"' in line
+        for line in response.text.splitlines()
+    )
+
+    response = requests.get(f"{CARS_SERVICE_URL}/manage/metrics")
+    assert response.status_code == 200
+    assert 'db_queries_total{operation="SELECT"}' in response.text
+
+# Bulk lookup tests
+def test_cars_batch_lookup():
+    """Test POST /api/v1/cars/batch reports found and missing cars"""
+    car_uid = "109b42f3-198d-4c89-9276-a7520a7120ab"
+    missing_uid = "00000000-0000-0000-0000-000000000000"
+    response = requests.post(
+        f"{CARS_SERVICE_URL}/api/v1/cars/batch",
+        json={"carUids": [car_uid, missing_uid, car_uid]}
+    )
+    print(f"POST /api/v1/cars/batch: {response.status_code}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["items"][car_uid]["carUid"] == car_uid
+    assert data["missing"] == [missing_uid]
+
+def test_payment_batch_lookup():
+    """Test POST /api/v1/payment/batch reports found and missing payments"""
+    response = requests.post(f"{PAYMENT_SERVICE_URL}/api/v1/payment", json={"price": 100})
+    assert response.status_code == 200
+    payment_uid = response.json()["paymentUid"]
+    missing_uid = "00000000-0000-0000-0000-000000000000"
+
+    response = requests.post(
+        f"{PAYMENT_SERVICE_URL}/api/v1/payment/batch",
+        json={"paymentUids": [payment_uid, missing_uid]}
+    )
+    print(f"POST /api/v1/payment/batch: {response.status_code}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["items"][payment_uid]["price"] == 100
+    assert data["missing"] == [missing_uid]
+
+def test_payment_idempotency_key_replay():
+    """Test POST /api/v1/payment with a reused Idempotency-Key returns the first payment"""
+    headers = {"Idempotency-Key": f"test-{uuid.uuid4()}"}
+    first = requests.post(f"{PAYMENT_SERVICE_URL}/api/v1/payment", json={"price": 100}, headers=headers)
+    second = requests.post(f"{PAYMENT_SERVICE_URL}/api/v1/payment", json={"price": 100}, headers=headers)
+    print(f"POST /api/v1/payment replay: {second.status_code}")
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers.get("Idempotent-Replayed") == "true"
+
+    response = requests.post(f"{PAYMENT_SERVICE_URL}/api/v1/payment", json={"price": 200}, headers=headers)
+    assert response.status_code == 422
+
+def test_payment_idempotency_key_void():
+    """Test DELETE /api/v1/payment/keys/{key} cancels the keyed payment, or blocks one made later"""
+    key = f"test-{uuid.uuid4()}"
+    first = requests.post(f"{PAYMENT_SERVICE_URL}/api/v1/payment", json={"price": 100}, headers={"Idempotency-Key": key})
+    assert first.status_code == 200
+    response = requests.delete(f"{PAYMENT_SERVICE_URL}/api/v1/payment/keys/{key}")
+    print(f"DELETE /api/v1/payment/keys/{{key}}: {response.status_code}")
+    assert response.status_code == 204
+    # A replay reports the payment as it is now
+    replay = requests.post(f"{PAYMENT_SERVICE_URL}/api/v1/payment", json={"price": 100}, headers={"Idempotency-Key": key})
+    assert replay.json()["paymentUid"] == first.json()["paymentUid"]
+    assert replay.json()["status"] == "CANCELED"
+
+    key = f"test-{uuid.uuid4()}"
+    assert requests.delete(f"{PAYMENT_SERVICE_URL}/api/v1/payment/keys/{key}").status_code == 204
+    late = requests.post(f"{PAYMENT_SERVICE_URL}/api/v1/payment", json={"price": 100}, headers={"Idempotency-Key": key})
+    assert late.status_code == 409
+
 # Gateway API tests
 def test_get_cars():
     """Test GET /api/v1/cars endpoint"""
@@ -52,6 +145,20 @@ def test_get_cars():
     assert "pageSize" in data
     assert "totalElements" in data
 
+def test_get_cars_conditional():
+    """Test GET /api/v1/cars answers a matching If-None-Match with 304"""
+    response = requests.get(f"{BASE_URL}/api/v1/cars?page=1&size=10&showAll=true")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = requests.get(
+        f"{BASE_URL}/api/v1/cars?page=1&size=10&showAll=true",
+        headers={"If-None-Match": etag}
+    )
+    print(f"GET /api/v1/cars conditional: {response.status_code}")
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
 def test_get_user_rentals():
     """Test GET /api/v1/rental endpoint"""
     headers = {"X-User-Name": "Test Max"}
@@ -93,6 +200,11 @@ def test_create_and_cancel_rental():
     print(f"DELETE /api/v1/rental/{rental_uid}: {response.status_code}")
     assert response.status_code == 204
 
+    # The payment is canceled before the DELETE answers
+    response = requests.get(f"{BASE_URL}/api/v1/rental/{rental_uid}", headers=headers)
+    assert response.json()["status"] == "CANCELED"
+    assert response.json()["payment"]["status"] == "CANCELED"
+
 def test_create_and_finish_rental():
     """Test POST /api/v1/rental/{rental_uid}/finish endpoint"""
     headers = {"X-User-Name": "Test Max"}
@@ -120,5 +232,63 @@ def test_create_and_finish_rental():
     data = response.json()
     assert data["status"] == "FINISHED"
 
+def test_cars_free_between_dates():
+    """Test GET /api/v1/cars?dateFrom&dateTo leaves out cars booked for an overlapping range"""
+    headers = {"X-User-Name": "Test Max"}
+    car_uid = "109b42f3-198d-4c89-9276-a7520a7120ab"
+    rental_data = {"carUid": car_uid, "dateFrom": "2031-01-10", "dateTo": "2031-01-13"}
+    response = requests.post(f"{BASE_URL}/api/v1/rental", json=rental_data, headers=headers)
+    assert response.status_code == 200
+    rental_uid = response.json()["rentalUid"]
+
+    response = requests.get(f"{BASE_URL}/api/v1/cars?size=100&dateFrom=2031-01-11&dateTo=2031-01-12")
+    print(f"GET /api/v1/cars overlapping range: {response.status_code}")
+    assert response.status_code == 200
+    assert car_uid not in {car["carUid"] for car in response.json()["items"]}
+
+    # The return day is free for the next renter
+    response = requests.get(f"{BASE_URL}/api/v1/cars?size=100&dateFrom=2031-01-13&dateTo=2031-01-15")
+    assert response.status_code == 200
+    assert car_uid in {car["carUid"] for car in response.json()["items"]}
+
+    response = requests.delete(f"{BASE_URL}/api/v1/rental/{rental_uid}", headers=headers)
+    assert response.status_code == 204
+
+def test_repeated_cancel_keeps_next_booking():
+    """Test canceling a rental again does not release the dates someone booked after it"""
+    car_uid = "109b42f3-198d-4c89-9276-a7520a7120ab"
+    rental_data = {"carUid": car_uid, "dateFrom": "2031-03-10", "dateTo": "2031-03-13"}
+    first = {"X-User-Name": "Test Max"}
+    second = {"X-User-Name": "Test Ann"}
+    response = requests.post(f"{BASE_URL}/api/v1/rental", json=rental_data, headers=first)
+    assert response.status_code == 200
+    first_uid = response.json()["rentalUid"]
+    assert requests.delete(f"{BASE_URL}/api/v1/rental/{first_uid}", headers=first).status_code == 204
+
+    response = requests.post(f"{BASE_URL}/api/v1/rental", json=rental_data, headers=second)
+    assert response.status_code == 200
+    second_uid = response.json()["rentalUid"]
+    try:
+        response = requests.delete(f"{BASE_URL}/api/v1/rental/{first_uid}", headers=first)
+        print(f"DELETE of a canceled rental: {response.status_code}")
+        assert response.status_code == 204
+        # The second renter still holds the dates
+        response = requests.post(f"{BASE_URL}/api/v1/rental", json=rental_data, headers=first)
+        assert response.status_code == 409
+    finally:
+        requests.delete(f"{BASE_URL}/api/v1/rental/{second_uid}", headers=second)
+
+def test_undated_hold_blocks_dated_booking():
+    """Test a car reserved without dates cannot also be booked for a date range"""
+    car_url = f"{CARS_SERVICE_URL}/api/v1/cars/109b42f3-198d-4c89-9276-a7520a7120ab"
+    response = requests.post(f"{car_url}/reserve")
+    assert response.status_code == 200
+    try:
+        response = requests.post(f"{car_url}/reserve", json={"dateFrom": "2031-02-01", "dateTo": "2031-02-03"})
+        print(f"POST reserve with dates during an undated hold: {response.status_code}")
+        assert response.status_code == 409
+    finally:
+        requests.patch(f"{car_url}/availability", params={"available": True})
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])